@@ -0,0 +1,186 @@
+# api.py
+from flask import Blueprint, current_app, jsonify, request, session
+from functools import wraps
+from library_system import LIB
+
+
+API_PREFIX = '/api/v1'
+
+# Catalog reads may be served by a shared cache for a few seconds; anything
+# tied to a user must be revalidated against the ETag on every use
+CATALOG_CACHE_CONTROL = 'public, max-age=5, stale-while-revalidate=30'
+PRIVATE_CACHE_CONTROL = 'private, no-cache'
+
+api = Blueprint('api', __name__, url_prefix=API_PREFIX)
+
+
+def library():
+    return current_app.config['LIBRARY']
+
+
+def transaction_query():
+    """Cursor, page size and filters for the transaction listings"""
+    filters = {name: request.args.get(name) or None
+               for name in ('status', 'member_id', 'date_from', 'date_to')}
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    return request.args.get('cursor') or None, limit, filters
+
+
+def error(message, status):
+    return jsonify({'error': message}), status
+
+
+def api_user():
+    """Agent for the session user or for HTTP Basic credentials"""
+    if 'user' in session:
+        return library().get_agent(session['user']['username'], session['user']['type'])
+    auth = request.authorization
+    if auth and auth.username and auth.password is not None:
+        role = library().authenticate_user(auth.username, auth.password)
+        if role:
+            return library().get_agent(auth.username, role)
+    return None
+
+
+def api_auth(role=None):
+    """Require a logged in user, optionally of the given role"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            user = api_user()
+            if user is None:
+                response = jsonify({'error': 'Authentication required'})
+                response.headers['WWW-Authenticate'] = 'Basic realm="library"'
+                return response, 401
+            if role is not None and library().users[user.username]['role'] != role:
+                return error(f'{role.capitalize()} access required', 403)
+            return f(user, *args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def conditional(cache_control):
+    """Tag responses with the graph ETag and answer If-None-Match with 304.
+
+    The tag is read before the view runs, so a 304 never touches the graph
+    and a body is never labelled with a newer generation than it reflects.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            etag = library().etag()
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = cache_control
+            response.vary.add('Authorization')
+            response.vary.add('Cookie')
+            return response
+        return decorated_function
+    return decorator
+
+
+def book_uri(book_id):
+    return LIB[book_id] if book_id.startswith('book_') else None
+
+
+def book_json(record):
+    return {
+        'id': record['uri'].split('#')[-1],
+        'title': record['title'],
+        'isbn': record['ISBN'],
+        'author': record['author'],
+        'year': record['year'],
+        'available': record['available_copies'] > 0,
+        'copies': record['copies'],
+        'available_copies': record['available_copies'],
+        'uri': record['uri'],
+    }
+
+
+@api.route('/books')
+@conditional(CATALOG_CACHE_CONTROL)
+def search_books():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return error('Missing query parameter q', 400)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+    results = library().search_books(query, page=page, per_page=per_page)
+    return jsonify(dict(results, results=[book_json(record) for record in results['results']]))
+
+
+@api.route('/books/<book_id>')
+@conditional(CATALOG_CACHE_CONTROL)
+def book_detail(book_id):
+    uri = book_uri(book_id)
+    record = library().get_book(uri) if uri else None
+    if record is None:
+        return error('Book not found', 404)
+    return jsonify(book_json(record))
+
+
+@api.route('/books/<book_id>/availability')
+@conditional(CATALOG_CACHE_CONTROL)
+def book_availability(book_id):
+    uri = book_uri(book_id)
+    record = library().get_book(uri) if uri else None
+    if record is None:
+        return error('Book not found', 404)
+    return jsonify({'id': book_id, 'available': record['available_copies'] > 0,
+                    'copies': record['copies'], 'available_copies': record['available_copies']})
+
+
+@api.route('/books/<book_id>/borrow', methods=['POST'])
+@api_auth('member')
+def borrow_book(user, book_id):
+    uri = book_uri(book_id)
+    if uri is None or library().get_book(uri) is None:
+        return error('Book not found', 404)
+    success, message = user.borrow_book(uri)
+    response = jsonify({'success': success, 'message': message})
+    response.headers['Cache-Control'] = 'no-store'
+    return response, 200 if success else 409
+
+
+@api.route('/books/<book_id>/return', methods=['POST'])
+@api_auth('member')
+def return_book(user, book_id):
+    uri = book_uri(book_id)
+    if uri is None or library().get_book(uri) is None:
+        return error('Book not found', 404)
+    success, message = user.return_book(uri)
+    response = jsonify({'success': success, 'message': message})
+    response.headers['Cache-Control'] = 'no-store'
+    return response, 200 if success else 409
+
+
+@api.route('/loans')
+@api_auth('member')
+@conditional(PRIVATE_CACHE_CONTROL)
+def my_loans(user):
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    loans = user.my_loans(request.args.get('status') or None, limit)
+    return jsonify({
+        'loans': [dict(details, id=transaction_id) for transaction_id, details in loans.items()],
+        'max_active_loans': library().max_active_loans,
+    })
+
+
+@api.route('/transactions')
+@api_auth('admin')
+@conditional(PRIVATE_CACHE_CONTROL)
+def transactions(user):
+    cursor, limit, filters = transaction_query()
+    try:
+        page, next_cursor = library().transactions_page(cursor, limit, **filters)
+    except ValueError as e:
+        return error(str(e), 400)
+    return jsonify({
+        'transactions': [dict(details, id=transaction_id) for transaction_id, details in page.items()],
+        'next_cursor': next_cursor
+    })
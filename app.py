@@ -1,13 +1,49 @@
 # app.py
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
-from library_system import LibraryModel, AdminAgent, MemberAgent
+from flask import Flask, Response, g, render_template, request, redirect, url_for, flash, jsonify, session, stream_with_context
+from library_system import LibraryModel, utc_timestamp
+from bulk_import import detect_format, open_upload
+from api import api, transaction_query
+from metrics import REGISTRY as metrics, instrument_stream
 from functools import wraps
+import datetime
+import itertools
+import json
+import os
+import time
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key_here'  # Required for session management
 
 # Initialize library model
-library = LibraryModel()
+# Set LIBRARY_PERSISTENCE=shared when running several worker processes
+library = LibraryModel(persistence=os.environ.get('LIBRARY_PERSISTENCE', 'snapshot'),
+                       max_active_loans=int(os.environ.get('LIBRARY_MAX_ACTIVE_LOANS', 5)),
+                       group_commit=os.environ.get('LIBRARY_GROUP_COMMIT') == '1')
+app.config['LIBRARY'] = library
+
+# Versioned JSON API for kiosks and mobile clients
+app.register_blueprint(api)
+
+@app.before_request
+def start_timer():
+    if metrics.enabled:
+        g.request_started = time.perf_counter()
+
+@app.before_request
+def sync_library():
+    # Apply what other worker processes wrote since the last request
+    library.sync()
+
+@app.after_request
+def record_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # Label by route pattern rather than path to keep the label set bounded
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        labels = {'route': route, 'method': request.method, 'status': response.status_code}
+        metrics.observe('http_request_seconds', time.perf_counter() - started, **labels)
+        metrics.inc('http_requests_total', **labels)
+    return response
 
 def get_user_dict(user, user_type):
     """Convert user object to serializable dictionary"""
@@ -42,12 +78,7 @@ def admin_required(f):
 
 def get_user_object(session_user):
     """Get actual user object from session data"""
-    if session_user['type'] == 'admin':
-        return next((agent for agent in library.schedule.agents 
-                    if isinstance(agent, AdminAgent) and agent.username == session_user['username']), None)
-    else:
-        return next((agent for agent in library.schedule.agents 
-                    if isinstance(agent, MemberAgent) and agent.username == session_user['username']), None)
+    return library.get_agent(session_user['username'], session_user['type'])
 
 
 @app.route('/')
@@ -65,8 +96,7 @@ def login():
         print(f"Authentication result: {user_type}")  # Debug log
         
         if user_type == 'admin':
-            user = next((agent for agent in library.schedule.agents 
-                        if isinstance(agent, AdminAgent) and agent.username == username), None)
+            user = library.get_agent(username, 'admin')
             if user:
                 session['user'] = get_user_dict(user, 'admin')
                 session['user_type'] = 'admin'
@@ -74,8 +104,7 @@ def login():
                 return redirect(url_for('dashboard'))
                 
         elif user_type == 'member':
-            user = next((agent for agent in library.schedule.agents 
-                        if isinstance(agent, MemberAgent) and agent.username == username), None)
+            user = library.get_agent(username, 'member')
             if user:
                 session['user'] = get_user_dict(user, 'member')
                 session['user_type'] = 'member'
@@ -107,6 +136,19 @@ def search():
         return render_template('search.html', book=book)
     return render_template('search.html')
 
+@app.route('/search_books')
+@login_required
+def search_books():
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    results = library.search_books(query, page=page) if query else None
+    return render_template('search_results.html', query=query, results=results)
+
+@app.route('/search/suggest')
+@login_required
+def suggest_titles():
+    return jsonify(library.suggest_titles(request.args.get('q', '')))
+
 @app.route('/add_book', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -122,10 +164,11 @@ def add_book():
         author = request.form['author']
         year = request.form['year']
         category = request.form['category']
+        copies = max(request.form.get('copies', 1, type=int) or 1, 1)
         
         # success = session['user'].add_book(title, isbn, author, year, category)
         
-        success = user.add_book(title, isbn, author, year, category)
+        success = user.add_book(title, isbn, author, year, category, copies=copies)
 
         if success:
             flash('Book added successfully!')
@@ -134,6 +177,29 @@ def add_book():
             
     return render_template('add_book.html')
 
+@app.route('/import_books', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def import_books():
+    report = None
+    if request.method == 'POST':
+        user = get_user_object(session['user'])
+        if not user:
+            return redirect(url_for('logout'))
+
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Choose a CSV or JSONL file to import')
+        else:
+            try:
+                report = user.import_books(open_upload(upload), detect_format(upload.filename))
+            except ValueError as e:
+                flash(str(e))
+            else:
+                flash(f"Imported {report['imported']} books" if report['saved'] else 'Failed to save imported books')
+
+    return render_template('import_books.html', report=report)
+
 @app.route('/remove_book', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -164,8 +230,71 @@ def transactions():
     if not user:
         return redirect(url_for('logout'))
         
-    transactions = user.view_all_transactions()
-    return render_template('transactions.html', transactions=transactions)
+    cursor, limit, filters = transaction_query()
+    try:
+        transactions, next_cursor = library.transactions_page(cursor, limit, descending=True, **filters)
+    except ValueError:
+        flash('Invalid page cursor')
+        return redirect(url_for('transactions'))
+    return render_template('transactions.html', transactions=transactions,
+                           next_cursor=next_cursor, filters=filters, limit=limit)
+
+@app.route('/transactions.json')
+@login_required
+@admin_required
+def transactions_json():
+    cursor, limit, filters = transaction_query()
+    try:
+        transactions, next_cursor = library.transactions_page(cursor, limit, **filters)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'transactions': [dict(details, id=transaction_id) for transaction_id, details in transactions.items()],
+        'next_cursor': next_cursor
+    })
+
+@app.route('/transactions.ndjson')
+@login_required
+@admin_required
+def transactions_ndjson():
+    """Stream every matching transaction as one JSON object per line"""
+    cursor, _, filters = transaction_query()
+    try:
+        rows = instrument_stream('stream_transactions', library.iter_transactions(cursor, **filters))
+        first = next(rows, None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def generate():
+        if first is None:
+            return
+        for item_cursor, transaction_id, details in itertools.chain([first], rows):
+            yield json.dumps(dict(details, id=transaction_id, cursor=item_cursor)) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/export')
+@login_required
+@admin_required
+def export():
+    """Chunked download of books, members and/or transactions"""
+    export_format = request.args.get('format', 'jsonl')
+    entity_type = request.args.get('type') or None
+    # Rows changed after this moment belong to the next export
+    watermark = utc_timestamp()
+    # An unescaped '+' in the watermark's UTC offset arrives as a space
+    changed_since = request.args.get('changed_since', '').replace(' ', '+') or None
+    try:
+        lines = library.export_stream(export_format, entity_type, changed_since)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    extension = {'ntriples': 'nt', 'jsonl': 'jsonl', 'csv': 'csv'}[export_format]
+    mimetype = {'ntriples': 'application/n-triples', 'jsonl': 'application/x-ndjson', 'csv': 'text/csv'}[export_format]
+    response = Response(stream_with_context(lines), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f"attachment; filename={entity_type or 'library'}.{extension}"
+    response.headers['X-Export-Watermark'] = watermark
+    return response
 
 @app.route('/borrow', methods=['GET', 'POST'])
 @login_required
@@ -190,6 +319,70 @@ def borrow():
             
     return render_template('borrow.html')
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Counters and latency histograms in Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/return', methods=['GET', 'POST'])
+@login_required
+def return_book():
+    if session['user_type'] != 'member':
+        flash('Only members can return books')
+        return redirect(url_for('dashboard'))
+
+    user = get_user_object(session['user'])
+    if not user:
+        return redirect(url_for('logout'))
+
+    if request.method == 'POST':
+        title = request.form['title']
+        book = library.search_book(title)
+
+        if book:
+            success, message = user.return_book(book['uri'])
+            flash(message)
+        else:
+            flash('Book not found')
+
+    return render_template('return.html')
+
+@app.route('/my_loans')
+@login_required
+def my_loans():
+    if session['user_type'] != 'member':
+        flash('Only members have loans')
+        return redirect(url_for('dashboard'))
+
+    user = get_user_object(session['user'])
+    if not user:
+        return redirect(url_for('logout'))
+
+    cursor = request.args.get('cursor') or None
+    try:
+        history, next_cursor = user.loan_history(cursor)
+    except ValueError:
+        flash('Invalid page')
+        return redirect(url_for('my_loans'))
+    return render_template('my_loans.html', active=user.my_loans(status='Active'), history=history,
+                           cursor=cursor, next_cursor=next_cursor,
+                           max_active_loans=library.max_active_loans)
+
+@app.route('/overdue')
+@login_required
+@admin_required
+def overdue():
+    as_of = request.args.get('as_of') or datetime.date.today().isoformat()
+    days = min(max(request.args.get('days', 7, type=int), 0), 365)
+    try:
+        overdue_loans = library.overdue_loans(as_of, limit=500)
+        due_soon = library.loans_due_soon(days, as_of, limit=500)
+    except ValueError:
+        flash('Invalid date')
+        return redirect(url_for('overdue'))
+    return render_template('overdue.html', overdue_loans=overdue_loans, due_soon=due_soon,
+                           as_of=as_of, days=days)
+
 @app.route('/logout')
 def logout():
     session.clear()
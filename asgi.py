@@ -0,0 +1,241 @@
+"""ASGI entry point serving the library from an asyncio event loop.
+
+Catalog reads are answered from the in-memory indexes on the loop's
+default thread pool, since they wait for the model lock while a write
+holds it. Borrows and returns go through a WriteQueue: the mutation runs
+on a small thread pool and the request then waits for the group commit
+flusher to save it, so graph serialization never blocks the loop. When
+LIBRARY_MAX_PENDING_WRITES writes are already in flight, further ones are
+refused with 503 and Retry-After instead of queueing. Every other route
+is served by the Flask app.
+
+Run with: uvicorn asgi:app
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import wraps
+import asyncio
+import os
+import time
+import warnings
+
+from itsdangerous import BadSignature
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import Authorization
+from werkzeug.http import parse_etags, quote_etag
+
+with warnings.catch_warnings():
+    warnings.simplefilter('ignore', DeprecationWarning)
+    from starlette.middleware.wsgi import WSGIMiddleware
+
+# Batch saves from concurrent writes; must be set before app builds the model
+os.environ.setdefault('LIBRARY_GROUP_COMMIT', '1')
+
+from api import API_PREFIX, CATALOG_CACHE_CONTROL, book_json, book_uri
+from app import app as flask_app, library
+from metrics import REGISTRY as metrics
+
+
+class Overloaded(Exception):
+    """The write queue is full"""
+
+
+class WriteQueue:
+    """Bounded executor for blocking writes, with admission control.
+
+    A write counts as pending from admission until its changes are saved.
+    Only the event loop touches the pending count, so it needs no lock.
+    """
+
+    def __init__(self, model, workers=4, max_pending=64):
+        self.model = model
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='library-write')
+        self.max_pending = max_pending
+        self.pending = 0
+
+    async def submit(self, func, *args):
+        """Run func(*args) on a worker and wait until its changes are saved.
+
+        func should apply its changes without waiting for the save itself.
+        Returns (result of func, whether the save succeeded).
+        """
+        if self.pending >= self.max_pending:
+            metrics.inc('library_writes_rejected_total')
+            raise Overloaded
+        self.pending += 1
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self.executor, func, *args)
+            # Always wait for a save of our own: with nothing pending the
+            # changes may still be in a batch being written, which can fail.
+            # Saves queued now run after that batch and retry what it requeues.
+            if self.model.flusher is None:
+                saved = await loop.run_in_executor(self.executor, self.model.save_graph)
+            else:
+                saved = await asyncio.wrap_future(self.model.save_graph_async())
+            return result, saved
+        finally:
+            self.pending -= 1
+
+    def close(self):
+        self.executor.shutdown()
+
+
+writes = WriteQueue(library,
+                    workers=int(os.environ.get('LIBRARY_WRITE_WORKERS', 4)),
+                    max_pending=int(os.environ.get('LIBRARY_MAX_PENDING_WRITES', 64)))
+
+
+async def offload(func, *args):
+    """Run a blocking model call on the loop's default thread pool"""
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+def current_etag():
+    library.sync()
+    return library.etag()
+
+
+def error(message, status):
+    return JSONResponse({'error': message}, status)
+
+
+def request_user(request):
+    """Agent for the Flask session user or for HTTP Basic credentials"""
+    cookie = request.cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if cookie:
+        serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+        try:
+            user = serializer.loads(cookie, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+        except BadSignature:
+            user = {}
+        if 'user' in user:
+            return library.get_agent(user['user']['username'], user['user']['type'])
+    auth = Authorization.from_header(request.headers.get('authorization'))
+    if auth and auth.username and auth.password is not None:
+        role = library.authenticate_user(auth.username, auth.password)
+        if role:
+            return library.get_agent(auth.username, role)
+    return None
+
+
+def timed(f):
+    """Record request latency like the Flask app does for its own routes"""
+    @wraps(f)
+    async def endpoint(request):
+        started = time.perf_counter()
+        response = await f(request)
+        labels = {'route': request.scope['route'].path, 'method': request.method,
+                  'status': response.status_code}
+        metrics.observe('http_request_seconds', time.perf_counter() - started, **labels)
+        metrics.inc('http_requests_total', **labels)
+        return response
+    return endpoint
+
+
+def conditional(cache_control):
+    """Tag responses with the graph ETag and answer If-None-Match with 304"""
+    def decorator(f):
+        @wraps(f)
+        async def endpoint(request):
+            etag = await offload(current_etag)
+            if parse_etags(request.headers.get('if-none-match')).contains_weak(etag):
+                response = Response(status_code=304)
+            else:
+                response = await f(request)
+                if response.status_code != 200:
+                    return response
+            response.headers['ETag'] = quote_etag(etag)
+            response.headers['Cache-Control'] = cache_control
+            response.headers['Vary'] = 'Authorization, Cookie'
+            return response
+        return endpoint
+    return decorator
+
+
+@timed
+@conditional(CATALOG_CACHE_CONTROL)
+async def search_books(request):
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return error('Missing query parameter q', 400)
+    try:
+        page = max(int(request.query_params.get('page', 1)), 1)
+        per_page = min(max(int(request.query_params.get('per_page', 20)), 1), 100)
+    except ValueError:
+        return error('page and per_page must be integers', 400)
+    results = await offload(library.search_books, query, page, per_page)
+    return JSONResponse(dict(results, results=[book_json(record) for record in results['results']]))
+
+
+@timed
+@conditional(CATALOG_CACHE_CONTROL)
+async def book_detail(request):
+    uri = book_uri(request.path_params['book_id'])
+    record = await offload(library.get_book, uri) if uri else None
+    if record is None:
+        return error('Book not found', 404)
+    return JSONResponse(book_json(record))
+
+
+@timed
+@conditional(CATALOG_CACHE_CONTROL)
+async def book_availability(request):
+    uri = book_uri(request.path_params['book_id'])
+    record = await offload(library.get_book, uri) if uri else None
+    if record is None:
+        return error('Book not found', 404)
+    return JSONResponse({'id': request.path_params['book_id'], 'available': record['available_copies'] > 0,
+                         'copies': record['copies'], 'available_copies': record['available_copies']})
+
+
+def loan_endpoint(action):
+    """Borrow or return endpoint running the member's action on the write queue"""
+    @timed
+    async def endpoint(request):
+        user = await offload(request_user, request)
+        if user is None:
+            return JSONResponse({'error': 'Authentication required'}, 401,
+                                headers={'WWW-Authenticate': 'Basic realm="library"'})
+        if library.users[user.username]['role'] != 'member':
+            return error('Member access required', 403)
+        uri = book_uri(request.path_params['book_id'])
+        if uri is None or await offload(library.get_book, uri) is None:
+            return error('Book not found', 404)
+        try:
+            (success, message), saved = await writes.submit(getattr(user, action), uri, False)
+        except Overloaded:
+            return JSONResponse({'error': 'Too many pending writes, try again shortly'}, 503,
+                                headers={'Retry-After': '1'})
+        if not saved:
+            return error('Failed to save changes', 500)
+        return JSONResponse({'success': success, 'message': message}, 200 if success else 409,
+                            headers={'Cache-Control': 'no-store'})
+    return endpoint
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    writes.close()
+    library.close()
+
+
+app = Starlette(
+    routes=[
+        Route(f'{API_PREFIX}/books', search_books),
+        Route(f'{API_PREFIX}/books/{{book_id}}', book_detail),
+        Route(f'{API_PREFIX}/books/{{book_id}}/availability', book_availability),
+        Route(f'{API_PREFIX}/books/{{book_id}}/borrow', loan_endpoint('borrow_book'), methods=['POST']),
+        Route(f'{API_PREFIX}/books/{{book_id}}/return', loan_endpoint('return_book'), methods=['POST']),
+        Mount('/', WSGIMiddleware(flask_app)),
+    ],
+    lifespan=lifespan,
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app)
@@ -0,0 +1,133 @@
+"""Compare the slotted read model against dict records and raw graph reads.
+
+Reports the memory held by the graph and by the read model built from it,
+the memory of book and transaction records in both layouts, and the latency of book lookups and transaction listings served from the
+read model versus rdflib lookups on the graph.
+
+Usage: python benchmarks/bench_read_model.py [--books 100000] [--transactions 50000]
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rdflib import Literal
+from bench_transactions import legacy_view_all_transactions
+from library_system import LIB, LibraryModel
+from persistence import MemoryPersistence
+from records import BookRecord, TransactionRecord
+from synthetic import book_title, generate_graph
+
+
+def traced_size(build):
+    """Bytes still allocated by build() once it returns, and its result"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return size, result
+
+
+def graph_book(graph, title):
+    """A book looked up by title straight from the graph"""
+    book = graph.value(predicate=LIB.title, object=Literal(title))
+    if book is None:
+        return None
+    return {
+        'title': str(graph.value(book, LIB.title)),
+        'ISBN': str(graph.value(book, LIB.ISBN)),
+        'author': str(graph.value(book, LIB.author)),
+        'year': str(graph.value(book, LIB.year)),
+        'isAvailable': str(graph.value(book, LIB.isAvailable)),
+        'uri': str(book),
+    }
+
+
+def per_call_us(function, arguments):
+    started = time.perf_counter()
+    for argument in arguments:
+        function(argument)
+    return 1e6 * (time.perf_counter() - started) / len(arguments)
+
+
+def best_of(function, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--members', type=int, default=10000)
+    parser.add_argument('--transactions', type=int, default=50000)
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"Building a graph with {args.books} books and {args.transactions} transactions...")
+    graph_size, graph = traced_size(lambda: generate_graph(books=args.books, members=args.members,
+                                                           transactions=args.transactions, seed=args.seed))
+    model = LibraryModel(persistence=MemoryPersistence(graph=graph), query_cache_size=0)
+    print(f"{len(graph)} triples")
+    # Rebuilding under tracing counts only the new indexes; the strings they
+    # share with the graph were allocated before and are not counted again
+    model_size, _ = traced_size(model.build_indexes)
+
+    print("\nFootprint")
+    print(f"  graph      {graph_size / 2**20:8.1f} MiB  ({graph_size / max(len(graph), 1):.0f} bytes per triple)")
+    print(f"  read model {model_size / 2**20:8.1f} MiB  ({model_size / max(graph_size, 1):.0%} of the graph)")
+
+    books = list(model.book_records.values())
+    transactions = list(model.transaction_records.values())
+    dict_books, _ = traced_size(lambda: [record.as_dict() for record in books])
+    slotted_books, _ = traced_size(lambda: [BookRecord(r.uri, r.title, r.isbn, r.author, r.year,
+                                                       r.copies, r.available_copies) for r in books])
+    dict_transactions, _ = traced_size(lambda: [
+        {'borrow_date': r.borrow_date, 'due_date': r.due_date, 'status': r.status,
+         'book': r.book, 'member': r.member, 'uri': r.uri} for r in transactions])
+    slotted_transactions, _ = traced_size(lambda: [
+        TransactionRecord(r.uri, r.borrow_date, r.due_date, r.status, r.book, r.member)
+        for r in transactions])
+
+    print("\nRecord memory (values shared, container overhead only)")
+    for name, as_dicts, slotted, count in (('books', dict_books, slotted_books, len(books)),
+                                           ('transactions', dict_transactions, slotted_transactions,
+                                            len(transactions))):
+        print(f"  {name:<13} dicts {as_dicts / 2**20:8.1f} MiB  slotted {slotted / 2**20:8.1f} MiB  "
+              f"({as_dicts / max(count, 1):.0f} vs {slotted / max(count, 1):.0f} bytes each)")
+
+    rng = random.Random(args.seed)
+    titles = [book_title(rng.randrange(args.books)) for _ in range(args.lookups)]
+    uris = [record.uri for record in rng.sample(transactions, min(args.lookups, len(transactions)))]
+    graph_search = per_call_us(lambda title: graph_book(graph, title), titles)
+    model_search = per_call_us(model.search_book, titles)
+    with model.lock.read_locked():
+        model_details = per_call_us(model.transaction_details, uris)
+    listing_graph, legacy = best_of(lambda: legacy_view_all_transactions(graph), args.repeat)
+    listing_model, listing = best_of(model.query_transactions, args.repeat)
+    assert listing == legacy, "read model disagrees with the graph"
+
+    print("\nLatency")
+    for name, from_graph, from_model, unit in (
+            ('search_book', graph_search, model_search, 'us'),
+            ('transaction_details', 1e6 * listing_graph / max(len(legacy), 1), model_details, 'us'),
+            ('view_all_transactions', listing_graph, listing_model, 's')):
+        print(f"  {name:<22} graph {from_graph:10.3f} {unit:<2}  read model {from_model:10.3f} {unit}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Compare view_all_transactions against the old per-transaction lookups.
+
+Usage: python benchmarks/bench_transactions.py [--transactions 100000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rdflib import RDF
+from library_system import LIB, AdminAgent, LibraryModel
+from persistence import MemoryPersistence
+from synthetic import generate_graph
+
+
+def legacy_view_all_transactions(graph):
+    """The original implementation: about ten graph lookups per transaction"""
+    transactions = {}
+    for transaction in graph.subjects(RDF.type, LIB.Transaction):
+        transaction_id = str(transaction).split('#')[-1]
+        transactions[transaction_id] = {
+            'borrow_date': str(graph.value(transaction, LIB.borrowDate)),
+            'due_date': str(graph.value(transaction, LIB.dueDate)),
+            'status': str(graph.value(transaction, LIB.transactionStatus) or 'Unknown'),
+            'book': {},
+            'member': {}
+        }
+        book = graph.value(transaction, LIB.involvesBook)
+        if book:
+            transactions[transaction_id]['book'] = {
+                'title': str(graph.value(book, LIB.title)),
+                'ISBN': str(graph.value(book, LIB.ISBN)),
+                'author': str(graph.value(book, LIB.author))
+            }
+        member_uri = graph.value(transaction, LIB.hasTransaction)
+        if member_uri and (member_uri, RDF.type, LIB.Member) in graph:
+            username = graph.value(member_uri, LIB.username)
+            member_id = graph.value(member_uri, LIB.memberID)
+            email = graph.value(member_uri, LIB.email)
+            transactions[transaction_id]['member'] = {
+                'username': str(username) if username else 'Unknown',
+                'member_id': str(member_id) if member_id else 'Unknown',
+                'email': str(email) if email else 'Unknown'
+            }
+    return transactions
+
+
+def timed(function, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--members', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"Building graph with {args.transactions} transactions...")
+    graph = generate_graph(books=args.books, members=args.members, transactions=args.transactions)
+    model = LibraryModel(persistence=MemoryPersistence(graph=graph), query_cache_size=0)
+    admin = AdminAgent(model.next_id(), model, "bench_admin", "")
+
+    legacy_seconds, legacy = timed(lambda: legacy_view_all_transactions(graph), args.repeat)
+    bulk_seconds, bulk = timed(admin.view_all_transactions, args.repeat)
+    filtered_seconds, filtered = timed(
+        lambda: admin.view_all_transactions(status="Active", date_from="2022-03-01", date_to="2022-05-31"),
+        args.repeat,
+    )
+    assert legacy == bulk, "bulk join disagrees with the legacy implementation"
+
+    print(f"legacy N+1 lookups: {legacy_seconds:.3f}s")
+    print(f"single-pass join:   {bulk_seconds:.3f}s ({legacy_seconds / bulk_seconds:.1f}x faster)")
+    print(f"filtered join:      {filtered_seconds:.3f}s ({len(filtered)} of {len(bulk)} transactions)")
+
+
+if __name__ == '__main__':
+    main()
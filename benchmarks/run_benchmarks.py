@@ -0,0 +1,272 @@
+"""Time LibraryModel hot paths against synthetic libraries of several sizes.
+
+For each catalog size a synthetic ontology is generated (see synthetic.py),
+loaded from disk, and every operation is timed. Results are written as
+JSON, by default to benchmarks/results/<commit>.json, so runs on different
+commits can be compared with --compare. Loading the ontology is timed both
+by parsing the RDF/XML (load_parse) and from the snapshot cache
+(load_cached, startup_cached).
+
+Search is also timed on its own against an index of --search-books books
+(1M by default), built without the graph so the catalog size is affordable.
+
+Usage: python benchmarks/run_benchmarks.py [--books 1000,10000] [--ops 200]
+           [--write-ops 10] [--persistence snapshot] [--search-books 1000000]
+           [--compare old.json]
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import rdflib
+from rdflib import RDF
+from library_system import LIB, LibraryModel, category_name
+from persistence import SnapshotPersistence
+from search_index import SearchIndex
+from synthetic import WORDS, book_title, iter_triples, member_credentials, write_ontology
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'total_s': sum(ordered),
+        'mean_ms': 1000 * sum(ordered) / len(ordered),
+        'p50_ms': 1000 * ordered[len(ordered) // 2],
+        'p95_ms': 1000 * ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+        'max_ms': 1000 * ordered[-1],
+    }
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return 'unknown'
+
+
+def bench_size(sizes, args):
+    """Run every operation against one synthetic library"""
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp()
+    try:
+        rdf_path = os.path.join(workdir, 'library_ontology.rdf')
+        generate_seconds, _ = timed(write_ontology, rdf_path, seed=args.seed, **sizes)
+
+        startup, model = timed(LibraryModel, rdf_path=rdf_path, persistence=args.persistence,
+                               query_cache_size=args.query_cache)
+        admin = model.get_agent('admin0')
+        samples = {'startup': [startup]}
+
+        # Loading the ontology by parsing the RDF/XML versus from the snapshot cache
+        samples['load_parse'] = [timed(SnapshotPersistence(rdf_path).load)[0] for _ in range(args.repeat)]
+        SnapshotPersistence(rdf_path, snapshot_cache=True).load()
+        samples['load_cached'] = [timed(SnapshotPersistence(rdf_path, snapshot_cache=True).load)[0]
+                                  for _ in range(args.repeat)]
+        samples['startup_cached'] = [timed(LibraryModel, rdf_path=rdf_path, persistence='snapshot',
+                                           snapshot_cache=True, query_cache_size=args.query_cache)[0]]
+
+        samples['authenticate_user'] = []
+        for _ in range(args.ops):
+            username, password = member_credentials(rng.randrange(sizes['members']))
+            seconds, role = timed(model.authenticate_user, username, password)
+            assert role == 'member'
+            samples['authenticate_user'].append(seconds)
+
+        samples['search_book'] = []
+        for _ in range(args.ops):
+            seconds, book = timed(model.search_book, book_title(rng.randrange(sizes['books'])))
+            assert book is not None
+            samples['search_book'].append(seconds)
+
+        samples['search_books'] = []
+        for _ in range(args.ops):
+            word = rng.choice(WORDS)
+            samples['search_books'].append(timed(model.search_books, word)[0])
+
+        samples['view_all_transactions'] = [timed(admin.view_all_transactions)[0]
+                                            for _ in range(args.repeat)]
+
+        with model.lock.read_locked():
+            available = sorted(uri for uri, record in model.book_records.items()
+                               if record.available_copies > 0)
+        samples['borrow_book'] = []
+        for uri in rng.sample(available, min(args.write_ops, len(available))):
+            username, _ = member_credentials(rng.randrange(sizes['members']))
+            seconds, (success, message) = timed(model.get_agent(username).borrow_book, uri)
+            assert success, message
+            samples['borrow_book'].append(seconds)
+
+        samples['add_book'] = []
+        for i in range(args.write_ops):
+            seconds, success = timed(admin.add_book, f"Benchmark Book {i}", f"bench-{i}",
+                                     "Benchmark Author", 2024, "benchmark")
+            assert success
+            samples['add_book'].append(seconds)
+
+        samples['remove_book'] = []
+        for i in range(args.write_ops):
+            uri = model.search_book(f"Benchmark Book {i}")['uri']
+            seconds, success = timed(admin.remove_book, uri)
+            assert success
+            samples['remove_book'].append(seconds)
+
+        # Time the save on its own, after a change that does not save itself
+        samples['save_graph'] = []
+        for i in range(args.repeat):
+            model.apply_changes(added=[(LIB.benchmark, LIB.run, rdflib.Literal(i))],
+                                removed=[(LIB.benchmark, LIB.run, None)])
+            samples['save_graph'].append(timed(model.save_graph)[0])
+
+        model.close()
+        return {
+            'sizes': sizes,
+            'triples': len(model.graph),
+            'generate_s': generate_seconds,
+            'operations': {name: summarize(values) for name, values in samples.items()},
+        }
+    finally:
+        shutil.rmtree(workdir)
+
+
+def search_queries(rng, books, count):
+    """Common words, word pairs, partial words, typos and title numbers"""
+    queries = []
+    for _ in range(count):
+        word, other = rng.choice(WORDS), rng.choice(WORDS)
+        queries += [word, f"{word} {other}", f"the {word} {other[:2]}",
+                    word[:-1] + word[-1] * 2, str(rng.randrange(books)), f"author {rng.randrange(max(books // 10, 1))}"]
+    return queries
+
+
+def bench_search(books, args):
+    """Time SearchIndex.search against an index of books synthetic books"""
+    rng = random.Random(args.seed)
+    index = SearchIndex()
+    fields = {}
+    started = time.perf_counter()
+    for subject, predicate, obj in iter_triples(books=books, members=1, transactions=0,
+                                                categories=args.categories, seed=args.seed):
+        if predicate == RDF.type and obj == LIB.Book:
+            fields = {}
+        elif predicate == LIB.title:
+            fields['title'] = str(obj)
+        elif predicate == LIB.author:
+            fields['author'] = str(obj)
+        elif predicate == LIB.hasCategory:
+            index.add(str(subject), dict(fields, category=category_name(obj)))
+    index.fold()
+    build_seconds = time.perf_counter() - started
+    # Keep full collections of the millions of index objects out of the timings
+    gc.collect()
+    gc.freeze()
+
+    samples = {'search': [], 'search_page_5': []}
+    for query in search_queries(rng, books, max(args.ops // 6, 1)):
+        samples['search'].append(timed(index.search, query)[0])
+        samples['search_page_5'].append(timed(index.search, query, page=5)[0])
+    return {
+        'books': len(index),
+        'build_s': build_seconds,
+        'operations': {name: summarize(values) for name, values in samples.items()},
+    }
+
+
+def compare(results, baseline_path):
+    """Print mean time ratios against an earlier results file"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {json.dumps(run['sizes'], sort_keys=True): run for run in baseline['runs']}
+    print(f"\nCompared with {baseline['commit']} (ratio > 1 is slower):")
+    for run in results['runs']:
+        old = previous.get(json.dumps(run['sizes'], sort_keys=True))
+        if old is None:
+            continue
+        print(f"  books={run['sizes']['books']}")
+        for name, stats in run['operations'].items():
+            if name in old['operations']:
+                ratio = stats['mean_ms'] / old['operations'][name]['mean_ms']
+                print(f"    {name:<22} {stats['mean_ms']:10.3f} ms  x{ratio:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', default='1000,10000',
+                        help='comma separated catalog sizes to benchmark')
+    parser.add_argument('--member-ratio', type=float, default=0.2)
+    parser.add_argument('--transaction-ratio', type=float, default=2.0)
+    parser.add_argument('--categories', type=int, default=50)
+    parser.add_argument('--ops', type=int, default=200, help='samples per read operation')
+    parser.add_argument('--write-ops', type=int, default=10, help='samples per mutating operation')
+    parser.add_argument('--repeat', type=int, default=3, help='samples per whole-graph operation')
+    parser.add_argument('--persistence', default='snapshot')
+    parser.add_argument('--search-books', type=int, default=1000000,
+                        help='catalog size of the search index benchmark; 0 skips it')
+    parser.add_argument('--query-cache', type=int, default=0,
+                        help='query cache size; 0 measures the uncached paths')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = {
+        'commit': commit,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'rdflib': rdflib.__version__,
+        'persistence': args.persistence,
+        'query_cache': args.query_cache,
+        'runs': [],
+    }
+    for books in (int(value) for value in args.books.split(',')):
+        sizes = {
+            'books': books,
+            'members': max(int(books * args.member_ratio), 1),
+            'categories': args.categories,
+            'transactions': int(books * args.transaction_ratio),
+        }
+        print(f"Benchmarking {sizes}...")
+        run = bench_size(sizes, args)
+        results['runs'].append(run)
+        for name, stats in run['operations'].items():
+            print(f"  {name:<22} mean {stats['mean_ms']:10.3f} ms  p95 {stats['p95_ms']:10.3f} ms")
+
+    if args.search_books:
+        print(f"Benchmarking search over {args.search_books} books...")
+        results['search'] = bench_search(args.search_books, args)
+        for name, stats in results['search']['operations'].items():
+            print(f"  {name:<22} mean {stats['mean_ms']:10.3f} ms  p95 {stats['p95_ms']:10.3f} ms"
+                  f"  max {stats['max_ms']:10.3f} ms")
+
+    output = args.output or os.path.join(BENCH_DIR, 'results', f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
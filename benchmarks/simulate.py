@@ -0,0 +1,64 @@
+"""Use LibraryModel's Mesa agents as a load generator.
+
+Builds an in-memory synthetic library, attaches a LoadSimulation and steps
+the model, then reports throughput, contention and latency per operation.
+
+Usage: python benchmarks/simulate.py [--members 5000] [--steps 20] [--workers 8]
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from library_system import LibraryModel
+from persistence import MemoryPersistence
+from simulation import DEFAULT_BEHAVIOUR, LoadSimulation
+from synthetic import generate_graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--members', type=int, default=5000)
+    parser.add_argument('--admins', type=int, default=2)
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    for name, default in DEFAULT_BEHAVIOUR.items():
+        option = '--' + name.replace('_', '-')
+        if isinstance(default, bool):
+            parser.add_argument(option, action='store_true', default=default)
+        else:
+            parser.add_argument(option, type=type(default), default=default)
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    graph = generate_graph(books=args.books, members=args.members, admins=args.admins,
+                           transactions=args.members, seed=args.seed)
+    model = LibraryModel(persistence=MemoryPersistence(graph=graph))
+    model.reset_randomizer(args.seed)
+    simulation = LoadSimulation(model, **{name: getattr(args, name) for name in DEFAULT_BEHAVIOUR})
+    try:
+        report = simulation.run(args.steps)
+    finally:
+        simulation.close()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{report['agents']} agents, {report['steps']} steps in {report['elapsed_s']:.2f}s")
+    for operation, stats in report['operations'].items():
+        outcomes = ', '.join(f"{name} {count}" for name, count in sorted(stats['outcomes'].items()))
+        print(f"  {operation:<12} {stats['throughput_per_s']:9.0f}/s  mean {stats['mean_ms']:8.3f} ms"
+              f"  p95 {stats['p95_ms']:8.3f} ms  p99 {stats['p99_ms']:8.3f} ms  ({outcomes})")
+    contention = report['contention']
+    print(f"  borrow conflicts {contention['borrow_conflicts']}, lock waits "
+          f"{contention['lock_read_waits']} read / {contention['lock_write_waits']} write, "
+          f"{contention['lock_wait_seconds']:.3f}s waiting; book lock waits "
+          f"{contention['book_lock_waits']}, {contention['book_lock_wait_seconds']:.3f}s waiting")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Hammer LibraryModel from many threads and check no book is borrowed twice.
+
+Member threads race to borrow the same small set of books while reader
+threads search continuously. Reports double borrows (expected: none) and
+read throughput while writes and saves are in progress.
+
+Usage: python benchmarks/stress_borrow.py [--members 32] [--readers 4]
+"""
+import argparse
+import collections
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rdflib import RDF
+from library_system import LIB, RDF_PATH, AdminAgent, LibraryModel, MemberAgent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=32)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--books', type=int, default=20)
+    parser.add_argument('--persistence', default='snapshot')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    rdf_path = os.path.join(workdir, 'library_ontology.rdf')
+    shutil.copy(RDF_PATH, rdf_path)
+    model = LibraryModel(rdf_path=rdf_path, persistence=args.persistence)
+
+    admin = AdminAgent(model.next_id(), model, "stress_admin", "")
+    for i in range(args.books):
+        admin.add_book(f"Stress Book {i}", f"isbn-{i}", "Stress", 2024, "stress")
+    book_uris = [model.search_book(f"Stress Book {i}")['uri'] for i in range(args.books)]
+    members = [MemberAgent(model.next_id(), model, f"stress{i}", "", str(9000 + i))
+               for i in range(args.members)]
+
+    start = threading.Barrier(args.members + args.readers + 1)
+    stop = threading.Event()
+    successes = collections.Counter()
+    reads = [0] * args.readers
+
+    def borrower(member):
+        start.wait()
+        for uri in book_uris:
+            ok, _ = member.borrow_book(uri)
+            if ok:
+                successes[uri] += 1
+
+    def reader(slot):
+        start.wait()
+        while not stop.is_set():
+            model.search_book(f"Stress Book {reads[slot] % args.books}")
+            model.search_books("stress book")
+            reads[slot] += 2
+
+    threads = [threading.Thread(target=borrower, args=(m,)) for m in members]
+    readers = [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    for thread in threads + readers:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in readers:
+        thread.join()
+
+    active = collections.Counter(
+        str(model.graph.value(transaction, LIB.involvesBook))
+        for transaction in model.graph.subjects(RDF.type, LIB.Transaction)
+        if str(model.graph.value(transaction, LIB.transactionStatus)) == "Active"
+    )
+    double_borrows = [uri for uri in book_uris if successes[uri] > 1 or active[uri] > 1]
+    shutil.rmtree(workdir)
+
+    print(f"borrow attempts:  {args.members * args.books} in {elapsed:.2f}s")
+    print(f"successful:       {sum(successes.values())} of {args.books} books")
+    print(f"double borrows:   {len(double_borrows)}")
+    print(f"read throughput:  {sum(reads) / elapsed:.0f} searches/s during writes")
+    sys.exit(1 if double_borrows else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Deterministic synthetic library ontology for benchmarks.
+
+The same sizes and seed always produce the same triples, so timings taken
+on different commits run against identical data.
+
+Usage: python benchmarks/synthetic.py out.rdf [--books 100000] [--members 20000]
+           [--categories 50] [--transactions 200000] [--seed 0]
+
+The output format follows the file extension (.rdf for RDF/XML, .nt, .ttl).
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rdflib import Graph, Literal, RDF, URIRef
+from rdflib.namespace import XSD
+from rdflib.util import guess_format
+from library_system import LIB
+
+
+START_DATE = datetime.date(2020, 1, 1)
+LOAN_DAYS = 30
+# Share of transactions that are still active, when their book is free
+ACTIVE_RATIO = 0.3
+
+WORDS = ("river night garden shadow empire silent winter glass iron house "
+         "stone letter storm golden hidden last city sea forest song light "
+         "crown secret journey broken moon fire north summer story").split()
+
+
+def book_uri(i):
+    return URIRef(f"{LIB}book_{i}")
+
+
+def member_uri(i):
+    return URIRef(f"{LIB}member_{i}")
+
+
+def book_title(i):
+    """Unique, deterministic title of synthetic book i"""
+    rng = random.Random(i)
+    return f"The {rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {i}"
+
+
+def member_credentials(i):
+    return f"member{i}", f"pass{i}"
+
+
+def iter_triples(books=1000, members=200, categories=20, transactions=2000, admins=1, seed=0):
+    """Yield the triples of a synthetic library one at a time"""
+    rng = random.Random(seed)
+    true = Literal('true', datatype=XSD.boolean)
+    false = Literal('false', datatype=XSD.boolean)
+
+    for i in range(admins):
+        admin = URIRef(f"{LIB}admin_{i}")
+        yield admin, RDF.type, LIB.Admin
+        yield admin, LIB.username, Literal(f"admin{i}")
+        yield admin, LIB.password, Literal(f"admin{i}")
+        yield admin, LIB.email, Literal(f"admin{i}@library.example")
+
+    for i in range(members):
+        member = member_uri(i)
+        username, password = member_credentials(i)
+        yield member, RDF.type, LIB.Member
+        yield member, LIB.username, Literal(username)
+        yield member, LIB.password, Literal(password)
+        yield member, LIB.email, Literal(f"{username}@example.com")
+        yield member, LIB.memberID, Literal(str(1000 + i))
+        yield member, LIB.joinDate, Literal(
+            (START_DATE + datetime.timedelta(days=rng.randrange(1500))).isoformat(), datatype=XSD.date)
+
+    # Generate loans first so book availability agrees with active transactions
+    on_loan = {}
+    loans = []
+    for i in range(transactions):
+        book = rng.randrange(books)
+        member = rng.randrange(members)
+        borrow_date = START_DATE + datetime.timedelta(days=rng.randrange(1500))
+        active = book not in on_loan and rng.random() < ACTIVE_RATIO
+        if active:
+            on_loan[book] = member
+        loans.append((i, book, member, borrow_date, active))
+
+    for i in range(books):
+        book = book_uri(i)
+        yield book, RDF.type, LIB.Book
+        yield book, LIB.title, Literal(book_title(i))
+        yield book, LIB.ISBN, Literal(f"978{i:010d}")
+        yield book, LIB.author, Literal(f"Author {rng.randrange(max(books // 10, 1))}")
+        yield book, LIB.year, Literal(1900 + rng.randrange(125), datatype=XSD.integer)
+        yield book, LIB.hasCategory, URIRef(f"{LIB}category_{rng.randrange(categories)}")
+        if i in on_loan:
+            yield book, LIB.isAvailable, false
+            yield book, LIB.borrowedBy, member_uri(on_loan[i])
+        else:
+            yield book, LIB.isAvailable, true
+
+    for i, book, member, borrow_date, active in loans:
+        transaction = URIRef(f"{LIB}transaction_{i}")
+        yield transaction, RDF.type, LIB.Transaction
+        yield transaction, LIB.borrowDate, Literal(borrow_date.isoformat(), datatype=XSD.date)
+        yield transaction, LIB.dueDate, Literal(
+            (borrow_date + datetime.timedelta(days=LOAN_DAYS)).isoformat(), datatype=XSD.date)
+        yield transaction, LIB.involvesBook, book_uri(book)
+        yield transaction, LIB.transactionStatus, Literal("Active" if active else "Returned")
+        yield transaction, LIB.hasTransaction, member_uri(member)
+        yield member_uri(member), LIB.hasTransaction, transaction
+
+
+def generate_graph(**sizes):
+    """Synthetic library as an in-memory graph; see iter_triples for sizes"""
+    graph = Graph()
+    graph.bind("lib", LIB)
+    for triple in iter_triples(**sizes):
+        graph.add(triple)
+    return graph
+
+
+def write_ontology(path, **sizes):
+    """Write a synthetic library to path in the format its extension implies"""
+    format = guess_format(path) or "xml"
+    if format == "nt":
+        # N-Triples can be streamed without holding the graph in memory
+        from rdflib.plugins.serializers.nt import _nt_row
+        with open(path, "w", encoding="utf-8") as out:
+            for triple in iter_triples(**sizes):
+                out.write(_nt_row(triple))
+        return
+    generate_graph(**sizes).serialize(destination=path, format=format, encoding="utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path')
+    parser.add_argument('--books', type=int, default=1000)
+    parser.add_argument('--members', type=int, default=200)
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--transactions', type=int, default=2000)
+    parser.add_argument('--admins', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_ontology(args.path, books=args.books, members=args.members, categories=args.categories,
+                   transactions=args.transactions, admins=args.admins, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
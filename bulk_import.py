@@ -0,0 +1,137 @@
+from library_system import book_triples, normalize_isbn
+import csv
+import io
+import json
+import os
+
+
+REQUIRED_FIELDS = ('title', 'isbn', 'author', 'year', 'category')
+MAX_REPORTED_ERRORS = 1000
+
+
+def detect_format(source):
+    name = source if isinstance(source, str) else getattr(source, 'name', '')
+    extension = os.path.splitext(str(name))[1].lower()
+    if extension in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    if extension == '.csv':
+        return 'csv'
+    raise ValueError(f"Cannot tell the format of {name!r}; pass format='csv' or 'jsonl'")
+
+
+def iter_rows(stream, format):
+    """Yield (line number, raw row) pairs without reading the whole file"""
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif format == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, e
+                continue
+            yield line_number, row
+    else:
+        raise ValueError(f"Unsupported import format: {format}")
+
+
+def validate_row(row):
+    """Normalized book fields of a row, or ValueError describing the problem"""
+    if isinstance(row, Exception):
+        raise ValueError(f"Malformed row: {row}")
+    if not isinstance(row, dict):
+        raise ValueError("Row is not an object")
+    fields = {key.strip().lower(): value for key, value in row.items() if key}
+    missing = [field for field in REQUIRED_FIELDS if not str(fields.get(field) or '').strip()]
+    if missing:
+        raise ValueError(f"Missing {', '.join(missing)}")
+    try:
+        year = int(str(fields['year']).strip())
+    except ValueError:
+        raise ValueError(f"Invalid year: {fields['year']!r}")
+    copies = str(fields.get('copies') or '').strip() or '1'
+    try:
+        copies = int(copies)
+    except ValueError:
+        raise ValueError(f"Invalid copies: {fields['copies']!r}")
+    if copies < 1:
+        raise ValueError(f"Invalid copies: {fields['copies']!r}")
+    return {
+        'title': str(fields['title']).strip(),
+        'isbn': str(fields['isbn']).strip(),
+        'author': str(fields['author']).strip(),
+        'year': year,
+        'category': str(fields['category']).strip(),
+        'copies': copies,
+    }
+
+
+def import_books(model, source, format=None, batch_size=5000):
+    """Stream books from a CSV or JSONL file into the model.
+
+    source is a path or a text stream. Rows are validated as they are read,
+    rows whose ISBN is already in the catalog (or earlier in the file) are
+    skipped, and triples are applied in batches of batch_size books. An
+    optional copies column sets each work's copy count (default 1). The
+    graph is saved once at the end. Returns a report of counts and the
+    first MAX_REPORTED_ERRORS row errors as (line, message) pairs.
+    """
+    format = format or detect_format(source)
+    report = {'rows': 0, 'imported': 0, 'duplicates': 0, 'failed': 0, 'errors': [], 'saved': False}
+    seen = set()
+    batch = []
+
+    def flush():
+        # Re-check under the write lock: add_book may have added an ISBN since
+        with model.write_section(), model.lock.write_locked():
+            added = []
+            for isbn, triples in batch:
+                if isbn in model.isbn_index:
+                    report['imported'] -= 1
+                    report['duplicates'] += 1
+                else:
+                    added.extend(triples)
+            model.apply_changes(added=added)
+        batch.clear()
+
+    stream = open(source, newline='', encoding='utf-8') if isinstance(source, str) else source
+    try:
+        for line_number, row in iter_rows(stream, format):
+            report['rows'] += 1
+            try:
+                book = validate_row(row)
+            except ValueError as e:
+                report['failed'] += 1
+                if len(report['errors']) < MAX_REPORTED_ERRORS:
+                    report['errors'].append((line_number, str(e)))
+                continue
+
+            isbn = normalize_isbn(book['isbn'])
+            with model.lock.read_locked():
+                cataloged = isbn in model.isbn_index
+            if isbn in seen or cataloged:
+                report['duplicates'] += 1
+                continue
+            seen.add(isbn)
+
+            batch.append((isbn, book_triples(**book)))
+            report['imported'] += 1
+            if len(batch) == batch_size:
+                flush()
+        if batch:
+            flush()
+    finally:
+        if isinstance(source, str):
+            stream.close()
+
+    report['saved'] = model.save_graph() if report['imported'] else True
+    return report
+
+
+def open_upload(file_storage):
+    """Text stream over an uploaded file, decoded without buffering it all"""
+    return io.TextIOWrapper(file_storage.stream, encoding='utf-8', newline='')
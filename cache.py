@@ -0,0 +1,88 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+MISSING = object()
+
+
+class QueryCache:
+    """Bounded LRU cache of query results with a time to live.
+
+    Each entry may record the generation of the data it was computed from;
+    a lookup with a different current generation discards it. Individual
+    keys can also be invalidated directly when their inputs change.
+    A maxsize of 0 disables caching.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, generation=None):
+        """Cached value for key, or MISSING"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            value, entry_generation, expires_at = entry
+            if entry_generation != generation:
+                del self.entries[key]
+                self.invalidations += 1
+                self.misses += 1
+                return MISSING
+            if self.ttl is not None and self.clock() >= expires_at:
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, generation=None):
+        if not self.maxsize:
+            return
+        expires_at = self.clock() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            self.entries[key] = (value, generation, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
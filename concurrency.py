@@ -0,0 +1,168 @@
+from contextlib import contextmanager
+import threading
+import time
+
+
+class ReadWriteLock:
+    """Many concurrent readers or a single writer.
+
+    Waiting writers block new readers so a steady stream of searches cannot
+    starve a borrow. Threads that already hold the lock may re-acquire it
+    for reading, and the writer may also read, so helpers can be nested.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writer = None
+        self.write_depth = 0
+        self.writers_waiting = 0
+        self.local = threading.local()
+        # Contention counters: acquisitions that had to wait, and for how long
+        self.read_waits = 0
+        self.write_waits = 0
+        self.wait_seconds = 0.0
+
+    def acquire_read(self):
+        depth = getattr(self.local, 'read_depth', 0)
+        if depth or self.writer == threading.get_ident():
+            self.local.read_depth = depth + 1
+            return
+        with self.condition:
+            if self.writer is not None or self.writers_waiting:
+                started = time.perf_counter()
+                while self.writer is not None or self.writers_waiting:
+                    self.condition.wait()
+                self.read_waits += 1
+                self.wait_seconds += time.perf_counter() - started
+            self.readers += 1
+        self.local.read_depth = 1
+
+    def release_read(self):
+        self.local.read_depth -= 1
+        if self.local.read_depth or self.writer == threading.get_ident():
+            return
+        with self.condition:
+            self.readers -= 1
+            if not self.readers:
+                self.condition.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        if self.writer == me:
+            self.write_depth += 1
+            return
+        if getattr(self.local, 'read_depth', 0):
+            raise RuntimeError("Cannot upgrade a read lock to a write lock")
+        with self.condition:
+            self.writers_waiting += 1
+            if self.writer is not None or self.readers:
+                started = time.perf_counter()
+                while self.writer is not None or self.readers:
+                    self.condition.wait()
+                self.write_waits += 1
+                self.wait_seconds += time.perf_counter() - started
+            self.writers_waiting -= 1
+            self.writer = me
+            self.write_depth = 1
+
+    def release_write(self):
+        self.write_depth -= 1
+        if self.write_depth:
+            return
+        with self.condition:
+            self.writer = None
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {
+                'read_waits': self.read_waits,
+                'write_waits': self.write_waits,
+                'wait_seconds': self.wait_seconds,
+            }
+
+    @contextmanager
+    def read_locked(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write_locked(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class CountingLock:
+    """Mutex that counts acquisitions which found it already held"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def acquire(self):
+        if self.lock.acquire(blocking=False):
+            return True
+        started = time.perf_counter()
+        self.lock.acquire()
+        # Only the holder updates the counters, so they need no extra lock
+        self.waits += 1
+        self.wait_seconds += time.perf_counter() - started
+        return True
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class StripedLock:
+    """Fixed pool of locks shared between keys by hash.
+
+    Gives per-key mutual exclusion (for example per book) without keeping
+    a lock object alive for every key ever seen.
+    """
+
+    def __init__(self, stripes=256):
+        self.locks = [CountingLock() for _ in range(stripes)]
+
+    def __call__(self, key):
+        return self.locks[hash(key) % len(self.locks)]
+
+    @contextmanager
+    def holding(self, keys):
+        """Hold the locks of all keys at once.
+
+        Stripes are taken in index order, so two callers holding several
+        keys cannot deadlock, and a stripe shared by two keys is taken once.
+        """
+        stripes = sorted({hash(key) % len(self.locks) for key in keys})
+        for position, stripe in enumerate(stripes):
+            try:
+                self.locks[stripe].acquire()
+            except BaseException:
+                for held in reversed(stripes[:position]):
+                    self.locks[held].release()
+                raise
+        try:
+            yield
+        finally:
+            for stripe in reversed(stripes):
+                self.locks[stripe].release()
+
+    def stats(self):
+        return {
+            'waits': sum(lock.waits for lock in self.locks),
+            'wait_seconds': sum(lock.wait_seconds for lock in self.locks),
+        }
@@ -0,0 +1,180 @@
+from bisect import bisect_right
+from rdflib import RDF, URIRef
+from rdflib.plugins.serializers.nt import _nt_row
+from library_system import ENTITY_TYPES, LIB, category_name
+import csv
+import io
+import json
+
+
+EXPORT_FORMATS = ('ntriples', 'jsonl', 'csv')
+CHUNK_SIZE = 1000
+
+CSV_COLUMNS = {
+    'book': ['uri', 'title', 'ISBN', 'author', 'year', 'isAvailable', 'copies', 'available_copies', 'category', 'modified_at'],
+    'member': ['uri', 'username', 'member_id', 'email', 'join_date', 'modified_at'],
+    'transaction': ['uri', 'borrow_date', 'due_date', 'status', 'book_uri', 'member_uri', 'modified_at'],
+}
+
+# Never leave the system through an export
+PRIVATE_PREDICATES = {LIB.password}
+
+
+def entity_chunks(model, entity_type):
+    """Yield lists of entity URIs, CHUNK_SIZE at a time.
+
+    Transactions are walked through the ordered transaction index by key, so
+    only one chunk is held at a time. Books and members are taken from the
+    in-memory indexes as a list of URIs, never as materialized records.
+    """
+    if entity_type == 'transaction':
+        key = None
+        while True:
+            with model.lock.read_locked():
+                order = model.transaction_order
+                start = bisect_right(order, key) if key is not None else 0
+                chunk = order[start:start + CHUNK_SIZE]
+            if not chunk:
+                return
+            key = chunk[-1]
+            yield [URIRef(uri) for _, uri in chunk]
+        return
+
+    with model.lock.read_locked():
+        if entity_type == 'book':
+            uris = list(model.book_records)
+        else:
+            uris = [uri for uri, username in model.user_uris.items()
+                    if model.users[username]['role'] == 'member']
+    for start in range(0, len(uris), CHUNK_SIZE):
+        yield [URIRef(uri) for uri in uris[start:start + CHUNK_SIZE]]
+
+
+def archive_chunks(model):
+    """Yield (graph, subjects) for the transactions of archive partitions not loaded yet.
+
+    Each partition is read from storage on its own and dropped once
+    streamed, so exporting history never loads it into the model.
+    Transactions the model holds are left to entity_chunks.
+    """
+    persistence = model.persistence
+    if not hasattr(persistence, 'read_partition'):
+        return
+    with model.persist_lock:
+        with model.lock.read_locked():
+            names = persistence.unloaded()
+    for name in names:
+        # Saves append to partitions under persist_lock
+        with model.persist_lock:
+            if name in persistence.loaded:
+                continue
+            partition = persistence.read_partition(name)
+        with model.lock.read_locked():
+            subjects = [subject for subject in partition.subjects(RDF.type, LIB.Transaction)
+                        if str(subject) not in model.transaction_records]
+        for start in range(0, len(subjects), CHUNK_SIZE):
+            yield partition, subjects[start:start + CHUNK_SIZE]
+
+
+def literal(graph, subject, predicate):
+    value = graph.value(subject, predicate)
+    return str(value) if value is not None else None
+
+
+def entity_row(graph, entity_type, subject):
+    """Flat dict describing one entity"""
+    row = {'uri': str(subject), 'modified_at': literal(graph, subject, LIB.modifiedAt)}
+    if entity_type == 'book':
+        row.update({
+            'title': literal(graph, subject, LIB.title),
+            'ISBN': literal(graph, subject, LIB.ISBN),
+            'author': literal(graph, subject, LIB.author),
+            'year': literal(graph, subject, LIB.year),
+            'isAvailable': literal(graph, subject, LIB.isAvailable),
+            'copies': literal(graph, subject, LIB.copies),
+            'available_copies': literal(graph, subject, LIB.availableCopies),
+            'category': ' '.join(category_name(c) for c in graph.objects(subject, LIB.hasCategory)),
+        })
+    elif entity_type == 'member':
+        row.update({
+            'username': literal(graph, subject, LIB.username),
+            'member_id': literal(graph, subject, LIB.memberID),
+            'email': literal(graph, subject, LIB.email),
+            'join_date': literal(graph, subject, LIB.joinDate),
+        })
+    else:
+        row.update({
+            'borrow_date': literal(graph, subject, LIB.borrowDate),
+            'due_date': literal(graph, subject, LIB.dueDate),
+            'status': literal(graph, subject, LIB.transactionStatus),
+            'book_uri': literal(graph, subject, LIB.involvesBook),
+            'member_uri': literal(graph, subject, LIB.hasTransaction),
+        })
+        # Transactions recorded before modifiedAt existed still have a borrow date
+        row['modified_at'] = row['modified_at'] or row['borrow_date']
+    return row
+
+
+def csv_line(values):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+def export_lines(model, format='jsonl', entity_type=None, changed_since=None):
+    """Generator of export lines; see LibraryModel.export_stream"""
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {format}")
+    if entity_type is not None and entity_type not in ENTITY_TYPES:
+        raise ValueError(f"Unknown entity type: {entity_type}")
+    if format == 'csv' and entity_type is None:
+        raise ValueError("CSV exports need a single entity type")
+    entity_types = [entity_type] if entity_type else list(ENTITY_TYPES)
+    return _export_lines(model, format, entity_types, changed_since)
+
+
+def _export_lines(model, format, entity_types, changed_since):
+    if format == 'csv':
+        yield csv_line(CSV_COLUMNS[entity_types[0]])
+
+    for entity_type in entity_types:
+        # Archived transactions streamed here may be loaded by the time
+        # entity_chunks reaches them
+        archived = set()
+        if entity_type == 'transaction':
+            for partition, chunk in archive_chunks(model):
+                archived.update(chunk)
+                yield from chunk_lines(partition, format, entity_type, chunk, changed_since, archive=True)
+        for chunk in entity_chunks(model, entity_type):
+            if archived:
+                chunk = [subject for subject in chunk if subject not in archived]
+            # Resolve the chunk under the read lock but yield outside it
+            with model.lock.read_locked():
+                lines = chunk_lines(model.graph, format, entity_type, chunk, changed_since)
+            yield from lines
+
+
+def chunk_lines(graph, format, entity_type, chunk, changed_since, archive=False):
+    """Export lines of the entities in chunk that changed since changed_since.
+
+    An archive partition also holds the member's hasTransaction link to each
+    of its transactions, which the loaded member does not carry, so N-Triples
+    from an archive include it.
+    """
+    lines = []
+    for subject in chunk:
+        if (subject, None, None) not in graph:
+            continue
+        row = entity_row(graph, entity_type, subject)
+        if changed_since is not None and (row['modified_at'] or '') < changed_since:
+            continue
+        if format == 'ntriples':
+            lines.extend(_nt_row(triple) for triple in graph.triples((subject, None, None))
+                         if triple[1] not in PRIVATE_PREDICATES)
+            if archive:
+                lines.extend(_nt_row(triple) for triple in graph.triples((None, LIB.hasTransaction, subject)))
+        elif format == 'jsonl':
+            lines.append(json.dumps(dict(row, type=entity_type)) + '\n')
+        else:
+            lines.append(csv_line([row[column] for column in CSV_COLUMNS[entity_type]]))
+    return lines
@@ -1,18 +1,23 @@
 from mesa import Agent, Model
 from mesa.time import RandomActivation
+from contextlib import contextmanager, nullcontext
 from rdflib import Graph, Literal, RDF, URIRef, Namespace
-from rdflib.namespace import RDFS, XSD
+from rdflib.namespace import XSD
+from concurrent.futures import Future
+from persistence import GroupCommitFlusher, make_persistence
+from search_index import SearchIndex
+from concurrency import ReadWriteLock, StripedLock
+from cache import MISSING, QueryCache
+from records import BookRecord, MemberRecord, TransactionRecord, optional_text, text
+from metrics import REGISTRY as metrics, instrument
+from bisect import bisect_left, bisect_right, insort
+import base64
+import threading
 import datetime
 import uuid
 import os
 
 
-# Load RDF Ontology
-g = Graph()
-try:
-    g.parse("library_ontology.rdf", format="xml")
-except Exception as e:
-    print(f"Warning: {e}. Creating new graph.")
 LIB = Namespace("http://www.library-system.org/ontology#")
 
 
@@ -20,69 +25,896 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 RDF_PATH = os.path.join(BASE_DIR, 'library_ontology.rdf')
 
 
+def normalize_isbn(isbn):
+    """Strip hyphens and spaces so ISBNs compare equal however they were typed"""
+    return isbn.replace('-', '').replace(' ', '').upper()
+
+
+# Entity kinds that carry a modifiedAt timestamp and can be exported
+ENTITY_TYPES = {
+    'book': LIB.Book,
+    'member': LIB.Member,
+    'transaction': LIB.Transaction,
+}
+
+
+def utc_timestamp():
+    """Current UTC time as a sortable ISO 8601 string"""
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="microseconds")
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode('|'.join(key).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        return tuple(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|', 1))
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def category_name(category_uri):
+    """Readable category name from a category_<name> URI"""
+    return str(category_uri).split('#')[-1].replace('category_', '', 1)
+
+
+# Predicates holding a work's copy count and availability
+HOLDING_PREDICATES = (LIB.copies, LIB.availableCopies, LIB.isAvailable)
+
+
+def holding_triples(book, copies, available):
+    """Copy count, available count and the derived isAvailable flag of a work"""
+    return [
+        (book, LIB.copies, Literal(copies, datatype=XSD.integer)),
+        (book, LIB.availableCopies, Literal(available, datatype=XSD.integer)),
+        (book, LIB.isAvailable, Literal('true' if available > 0 else 'false', datatype=XSD.boolean)),
+    ]
+
+
+def holding_patterns(book):
+    return [(book, predicate, None) for predicate in HOLDING_PREDICATES]
+
+
+def book_triples(title, isbn, author, year, category, copies=1):
+    """Triples describing a newly added work with all its copies available"""
+    book_id = str(uuid.uuid4())
+    book_uri = URIRef(f"http://www.library-system.org/ontology#book_{book_id}")
+    category_uri = URIRef(f"http://www.library-system.org/ontology#category_{category.lower()}")
+
+    # Add book properties with proper datatypes
+    return [
+        (book_uri, RDF.type, LIB.Book),
+        (book_uri, LIB.title, Literal(title)),
+        (book_uri, LIB.ISBN, Literal(isbn)),
+        (book_uri, LIB.author, Literal(author)),
+        (book_uri, LIB.year, Literal(year, datatype=XSD.integer)),
+        (book_uri, LIB.hasCategory, category_uri),
+    ] + holding_triples(book_uri, copies, copies)
+
+
 class LibraryModel(Model):
-    def __init__(self):
+    def __init__(self, rdf_path=RDF_PATH, persistence="snapshot", snapshot_cache=False,
+                 group_commit=False, flush_interval=0.05, flush_batch_size=64,
+                 query_cache_size=1024, query_cache_ttl=300.0, loan_period_days=30,
+                 max_active_loans=None):
         super().__init__()
         self.schedule = RandomActivation(self)
         self.running = True
-        self.graph = g
-        try:
-            self.graph.parse(RDF_PATH, format="xml")
-        except Exception as e:
-            print(f"Warning: {e}. Creating new graph.")
+        # Set by simulation.LoadSimulation to make agents act on each step
+        self.simulation = None
+        self.rdf_path = rdf_path
+        self.loan_period_days = loan_period_days
+        # Active loans a member may hold at once; None means no limit
+        self.max_active_loans = max_active_loans
+        self.persistence = make_persistence(persistence, rdf_path, snapshot_cache=snapshot_cache)
+        self.pending_changes = []
+        self.pending_lock = threading.Lock()
+        self.persist_lock = threading.Lock()
+        # Marks threads inside a write_section
+        self.section = threading.local()
+        # Readers share the graph, mutations are exclusive, borrows lock their book
+        self.lock = ReadWriteLock()
+        self.book_locks = StripedLock()
+        self.member_locks = StripedLock()
+        # Bumped on every mutation; API ETags are derived from it
+        self.generation = 0
+        self.generation_epoch = uuid.uuid4().hex[:8]
+        # Bumped whenever a book is indexed or unindexed
+        self.catalog_generation = 0
+        self.query_cache = QueryCache(query_cache_size, query_cache_ttl)
+        # Load RDF Ontology
+        self.graph = self.persistence.load()
+        self.build_indexes()
         self.init_agents()
-    
-    def save_graph(self):
-        """Safely save the graph with proper XML formatting"""
+
+        # Group commit: saves are queued and flushed together by a background thread
+        self.flusher = None
+        if group_commit:
+            self.flusher = GroupCommitFlusher(self.flush_pending, flush_interval, flush_batch_size)
+
+    def step(self):
+        """Advance the simulation by one tick"""
+        if self.simulation is not None:
+            self.simulation.step()
+        else:
+            self.schedule.step()
+
+    def apply_changes(self, added=(), removed=()):
+        """Apply triple changes to the graph and queue them for the next save.
+
+        Removals may be patterns containing None; they are expanded to the
+        concrete triples they match so the journal records exact triples.
+        Books, members and transactions that changed get a fresh modifiedAt
+        timestamp, which exports use as their changed-since watermark.
+        With shared persistence the changes are appended to the journal
+        before this returns.
+        """
+        with self.write_section(), self.lock.write_locked():
+            removed = [triple for pattern in removed for triple in self.graph.triples(pattern)]
+            changes = []
+            for triple in removed:
+                self.graph.remove(triple)
+                changes.append(("-", triple))
+            for triple in added:
+                self.graph.add(triple)
+                changes.append(("+", triple))
+            subjects = {triple[0] for _, triple in changes}
+            changes.extend(self.stamp_modified(subjects))
+            if hasattr(self.persistence, "route"):
+                # Partitions are decided while the graph holds exactly these changes
+                changes = self.persistence.route(self.graph, changes)
+            with self.pending_lock:
+                self.pending_changes.extend(changes)
+            self.refresh_indexes(subjects)
+            self.generation += 1
+
+    def stamp_modified(self, subjects):
+        """Set modifiedAt on the entities among subjects, returning the changes"""
+        changes = []
+        modified_at = None
+        for subject in subjects:
+            if not any((subject, RDF.type, entity_type) in self.graph for entity_type in ENTITY_TYPES.values()):
+                continue
+            if modified_at is None:
+                modified_at = Literal(utc_timestamp(), datatype=XSD.dateTime)
+            for triple in list(self.graph.triples((subject, LIB.modifiedAt, None))):
+                self.graph.remove(triple)
+                changes.append(("-", triple))
+            triple = (subject, LIB.modifiedAt, modified_at)
+            self.graph.add(triple)
+            changes.append(("+", triple))
+        return changes
+
+    def save_graph(self, durable=True):
+        """Persist pending changes with the configured persistence mode.
+
+        With group commit enabled the save is queued for the background
+        flusher; durable=True waits until the batch containing it is written,
+        durable=False returns immediately.
+        """
+        if self.flusher is None:
+            return self.flush_pending()
+        future = self.flusher.submit()
+        return future.result() if durable else True
+
+    def save_graph_async(self):
+        """Queue a save and return a Future resolving to its success"""
+        if self.flusher is None:
+            future = Future()
+            future.set_result(self.flush_pending())
+            return future
+        return self.flusher.submit()
+
+    def flush_pending(self):
+        """Write every queued change to storage in one go"""
+        with self.persist_lock:
+            return self._flush_pending()
+
+    @instrument('save')
+    def _flush_pending(self):
+        # Caller holds persist_lock
+        with self.pending_lock:
+            changes, self.pending_changes = self.pending_changes, []
+        if not changes:
+            return True
         try:
-            self.graph.serialize(
-                destination="library_ontology.rdf",
-                format="pretty-xml",
-                encoding="utf-8"
-            )
+            graph = self.snapshot_graph() if self.persistence.needs_snapshot else self.graph
+            with self.graph_locked(self.persistence.graph_lock):
+                written = self.persistence.persist(graph, changes)
         except Exception as e:
             print(f"Error saving graph: {e}")
+            with self.pending_lock:
+                self.pending_changes[:0] = changes
             return False
+        if written:
+            metrics.inc('library_save_bytes_total', written, backend=type(self.persistence).__name__)
+        if self.persistence.should_compact():
+            self._compact()
         return True
 
+    def graph_locked(self, mode):
+        """The model lock in the given mode ("read" or "write"), or no lock for None"""
+        if mode is None:
+            return nullcontext()
+        return self.lock.write_locked() if mode == "write" else self.lock.read_locked()
+
+    @contextmanager
+    def write_section(self):
+        """Make a read-check-write atomic across worker processes.
+
+        With shared persistence the section holds the journal lock: it first
+        applies what other workers appended, then runs the body, then
+        appends the body's changes. Nested sections join the outer one.
+        Without shared persistence the caller's own locks are enough.
+        """
+        if not self.persistence.shared or getattr(self.section, 'active', False):
+            yield
+            return
+        with self.persist_lock, self.persistence.locked():
+            self.section.active = True
+            try:
+                self._sync()
+                yield
+            finally:
+                self.section.active = False
+                self._flush_pending()
+
+    def sync(self):
+        """Apply changes other worker processes appended to a shared journal.
+
+        Cheap when there is nothing new, so it can run before every request.
+        Returns the number of triples applied.
+        """
+        if not self.persistence.shared or not self.persistence.has_changes():
+            return 0
+        with self.persist_lock, self.persistence.locked():
+            return self._sync()
+
+    def _sync(self):
+        # Caller holds persist_lock and the journal lock
+        changes = self.persistence.read_changes()
+        if not changes:
+            return 0
+        with self.lock.write_locked():
+            for op, triple in changes:
+                if op == "+":
+                    self.graph.add(triple)
+                else:
+                    self.graph.remove(triple)
+            self.refresh_indexes({triple[0] for _, triple in changes})
+            self.generation += 1
+        return len(changes)
+
+    def snapshot_graph(self):
+        """Copy of the graph taken under the read lock.
+
+        Serializing the copy instead of the live graph keeps slow saves from
+        holding off writers, which would in turn hold off new readers.
+        """
+        snapshot = Graph()
+        with self.lock.read_locked():
+            for prefix, namespace in self.graph.namespaces():
+                snapshot.bind(prefix, namespace)
+            snapshot.addN((s, p, o, snapshot) for s, p, o in self.graph)
+        return snapshot
+
+    def flush_stats(self):
+        """Batch size and flush latency counters of the group commit flusher"""
+        return self.flusher.get_stats() if self.flusher else None
+
+    def close(self):
+        """Stop the background flusher, writing out anything still queued"""
+        if self.flusher is not None:
+            self.flusher.stop()
+            self.flusher = None
+        return self.flush_pending()
+
+    def import_rdf(self, path, format="xml"):
+        """Merge an RDF file into the graph and persist the added triples"""
+        imported = Graph()
+        imported.parse(path, format=format)
+        self.apply_changes(added=list(imported))
+        return self.save_graph()
+
+    def export_rdf(self, path, format="pretty-xml"):
+        """Write the whole graph to an RDF file"""
+        try:
+            self.snapshot_graph().serialize(destination=path, format=format, encoding="utf-8")
+        except Exception as e:
+            print(f"Error exporting graph: {e}")
+            return False
+        return True
+
+    def compact(self):
+        """Fold the mutation journal into a new ontology snapshot"""
+        if not hasattr(self.persistence, "compact"):
+            return False
+        with self.persist_lock:
+            return self._compact()
+
+    def _compact(self):
+        # Caller holds persist_lock, so nothing is appended to the journal
+        # between taking the snapshot and truncating it
+        try:
+            if self.persistence.shared:
+                # The snapshot must include what other workers appended
+                with self.persistence.locked():
+                    self._sync()
+                    self.persistence.compact(self.snapshot_graph())
+            else:
+                self.persistence.compact(self.snapshot_graph())
+        except Exception as e:
+            print(f"Error compacting journal: {e}")
+            return False
+        return True
+
+    def migrate_holdings(self):
+        """Collapse book entities sharing an ISBN into one work with several copies.
+
+        The work with the smallest URI survives; copy and available counts of
+        the duplicates are added to it and every reference to a duplicate
+        (transactions, borrowedBy) is pointed at it.
+        Returns (works merged, duplicates removed).
+        """
+        # Archived transactions may point at duplicates too
+        self.load_history()
+        while True:
+            with self.lock.read_locked():
+                locked = {uri for uris in self.isbn_index.values() if len(uris) > 1 for uri in uris}
+            if not locked:
+                return 0, 0
+            # Borrows and returns hold a book's lock from reading its counts
+            # until they apply, so every book of a group is locked before the
+            # counts are summed under the write lock.
+            with self.book_locks.holding(locked), self.write_section(), self.lock.write_locked():
+                groups = [sorted(uris) for uris in self.isbn_index.values() if len(uris) > 1]
+                if not {uri for uris in groups for uri in uris} <= locked:
+                    # A book was cataloged under a duplicate ISBN meanwhile
+                    continue
+                if not groups:
+                    return 0, 0
+                removed, added = [], []
+                for survivor, *duplicates in groups:
+                    survivor = URIRef(survivor)
+                    records = [self.book_records[str(uri)] for uri in [survivor, *duplicates]]
+                    removed += holding_patterns(survivor)
+                    added += holding_triples(survivor, sum(record.copies for record in records),
+                                             sum(record.available_copies for record in records))
+                    for duplicate in map(URIRef, duplicates):
+                        for s, p, o in self.graph.triples((None, None, duplicate)):
+                            removed.append((s, p, o))
+                            added.append((s, p, survivor))
+                        for _, p, o in self.graph.triples((duplicate, LIB.borrowedBy, None)):
+                            added.append((survivor, p, o))
+                        removed.append((duplicate, None, None))
+                self.apply_changes(added=added, removed=removed)
+            return len(groups), sum(len(duplicates) for _, *duplicates in groups)
+
+    def load_history(self, date_from=None, date_to=None, member_uris=None, newest=None, oldest=None):
+        """Load archived transactions borrowed in the date range, if not loaded yet.
+
+        member_uris restricts loading to the months holding those members'
+        loans, newest to that many of the latest matching months and oldest
+        to that many of the earliest. Only
+        partitioned persistence keeps history out of memory; with any other
+        mode everything is loaded already. Returns the number of archive
+        partitions loaded.
+        """
+        if not hasattr(self.persistence, "load_partition"):
+            return 0
+        with self.persist_lock:
+            # The member manifest changes under the write lock
+            with self.lock.read_locked():
+                names = self.persistence.unloaded(date_from, date_to, member_uris)
+            if newest is not None:
+                names = names[-newest:]
+            if oldest is not None:
+                names = names[:oldest]
+            if not names:
+                return 0
+            partitions = [self.persistence.load_partition(name) for name in names]
+            with self.lock.write_locked():
+                transactions = set()
+                for partition in partitions:
+                    self.graph += partition
+                    transactions.update(partition.subjects(RDF.type, LIB.Transaction))
+                self.refresh_indexes(transactions)
+                self.generation += 1
+        metrics.inc('library_history_partitions_loaded_total', len(names))
+        return len(names)
+
+    def build_indexes(self):
+        """Build the in-memory lookup indexes from the loaded graph"""
+        self.query_cache.clear()
+        self.book_records = {}
+        self.title_index = {}
+        self.isbn_index = {}
+        self.search_index = SearchIndex()
+        for book in self.graph.subjects(RDF.type, LIB.Book):
+            self.index_book(book)
+        self.search_index.fold()
+
+        # Transactions, and their keys ordered by (borrow date, URI) for cursor pagination
+        self.transaction_records = {}
+        self.transaction_order = []
+        # Active loans ordered by (due date, URI) for overdue queries
+        self.due_order = []
+        # Each member's transactions ordered by (borrow date, URI), and active loan counts
+        self.member_transactions = {}
+        self.active_loan_counts = {}
+        for transaction in self.graph.subjects(RDF.type, LIB.Transaction):
+            self.index_transaction(transaction)
+
+    def refresh_indexes(self, subjects):
+        """Bring the indexes up to date for subjects whose triples changed"""
+        for subject in subjects:
+            if str(subject) in self.book_records:
+                self.unindex_book(subject)
+            if (subject, RDF.type, LIB.Book) in self.graph:
+                self.index_book(subject)
+            if str(subject) in self.transaction_records:
+                self.unindex_transaction(subject)
+            if (subject, RDF.type, LIB.Transaction) in self.graph:
+                self.index_transaction(subject)
+            if (str(subject) in self.user_uris or (subject, RDF.type, LIB.Admin) in self.graph
+                    or (subject, RDF.type, LIB.Member) in self.graph):
+                self.register_user(subject)
+
+    def index_transaction(self, transaction):
+        graph = self.graph
+        record = TransactionRecord(
+            text(transaction),
+            text(graph.value(transaction, LIB.borrowDate)),
+            optional_text(graph.value(transaction, LIB.dueDate)),
+            text(graph.value(transaction, LIB.transactionStatus) or 'Unknown'),
+            optional_text(graph.value(transaction, LIB.involvesBook)),
+            # hasTransaction links both ways; from the transaction it gives the member
+            optional_text(graph.value(transaction, LIB.hasTransaction)),
+        )
+        self.transaction_records[record.uri] = record
+        insort(self.transaction_order, record.key)
+        if record.due_date is not None and record.active:
+            insort(self.due_order, (record.due_date, record.uri))
+        member = record.member
+        if member is not None:
+            insort(self.member_transactions.setdefault(member, []), record.key)
+            if record.active:
+                self.active_loan_counts[member] = self.active_loan_counts.get(member, 0) + 1
+
+    def unindex_transaction(self, transaction):
+        record = self.transaction_records.pop(str(transaction))
+        key = record.key
+        del self.transaction_order[bisect_left(self.transaction_order, key)]
+        if record.due_date is not None and record.active:
+            del self.due_order[bisect_left(self.due_order, (record.due_date, record.uri))]
+        member = record.member
+        if member is not None:
+            keys = self.member_transactions[member]
+            del keys[bisect_left(keys, key)]
+            if not keys:
+                del self.member_transactions[member]
+            if record.active:
+                self.active_loan_counts[member] -= 1
+                if not self.active_loan_counts[member]:
+                    del self.active_loan_counts[member]
+
+    def holdings(self, book):
+        """(copies, available) of a work; books from before holdings count as one copy"""
+        copies = self.graph.value(book, LIB.copies)
+        available = self.graph.value(book, LIB.availableCopies)
+        copies = int(copies) if copies is not None else 1
+        if available is None:
+            available = copies if str(self.graph.value(book, LIB.isAvailable)).lower() == 'true' else 0
+        return copies, int(available)
+
+    def index_book(self, book):
+        graph = self.graph
+        uri = text(book)
+        copies, available = self.holdings(book)
+        record = BookRecord(
+            uri,
+            str(graph.value(book, LIB.title)),
+            str(graph.value(book, LIB.ISBN)),
+            text(graph.value(book, LIB.author)),
+            text(graph.value(book, LIB.year)),
+            copies,
+            available,
+        )
+        self.book_records[uri] = record
+        self.catalog_generation += 1
+        self.query_cache.invalidate(('search_book', record.title.lower()))
+        self.title_index.setdefault(record.title.lower(), []).append(uri)
+        self.isbn_index.setdefault(normalize_isbn(record.isbn), []).append(uri)
+        categories = ' '.join(category_name(c) for c in graph.objects(book, LIB.hasCategory))
+        self.search_index.add(uri, {
+            'title': record.title,
+            'author': record.author,
+            'category': categories,
+        })
+
+    def unindex_book(self, book):
+        record = self.book_records.pop(str(book))
+        self.catalog_generation += 1
+        self.query_cache.invalidate(('search_book', record.title.lower()))
+        self.search_index.remove(record.uri)
+        for index, key in ((self.title_index, record.title.lower()),
+                           (self.isbn_index, normalize_isbn(record.isbn))):
+            uris = index[key]
+            uris.remove(record.uri)
+            if not uris:
+                del index[key]
+
     def init_agents(self):
+        # Username-keyed registry of role, credentials and agent
+        self.users = {}
+        self.user_uris = {}
+        # Contact details of members, keyed by URI
+        self.member_records = {}
         for admin in self.graph.subjects(RDF.type, LIB.Admin):
-            username = str(self.graph.value(admin, LIB.username))
-            password = str(self.graph.value(admin, LIB.password))
-            admin_agent = AdminAgent(self.next_id(), self, username, password)
-            self.schedule.add(admin_agent)
-
+            self.register_user(admin)
         for member in self.graph.subjects(RDF.type, LIB.Member):
-            username = str(self.graph.value(member, LIB.username))
-            password = str(self.graph.value(member, LIB.password))
-            member_id = str(self.graph.value(member, LIB.memberID))
-            member_agent = MemberAgent(self.next_id(), self, username, password, member_id)
-            self.schedule.add(member_agent)
+            self.register_user(member)
 
+    def register_user(self, user):
+        """Add, update or drop the registry entry and agent of a user URI"""
+        uri = text(user)
+        if (user, RDF.type, LIB.Admin) in self.graph:
+            role = 'admin'
+        elif (user, RDF.type, LIB.Member) in self.graph:
+            role = 'member'
+        else:
+            role = None
+
+        previous = self.user_uris.pop(uri, None)
+        record = self.users.pop(previous, None) if previous is not None else None
+        agent = record['agent'] if record and record['role'] == role else None
+        if record and agent is None:
+            self.schedule.remove(record['agent'])
+        self.member_records.pop(uri, None)
+        if role is None:
+            return
+        if role == 'member':
+            self.member_records[uri] = self.member_record(user)
+
+        username = str(self.graph.value(user, LIB.username))
+        password = str(self.graph.value(user, LIB.password))
+        if username in self.users:
+            print(f"Warning: duplicate username {username}, ignoring {uri}")
+            if agent is not None:
+                self.schedule.remove(agent)
+            return
+
+        if role == 'admin':
+            if agent is None:
+                agent = AdminAgent(self.next_id(), self, username, password)
+                self.schedule.add(agent)
+        else:
+            member_id = str(self.graph.value(user, LIB.memberID))
+            if agent is None:
+                agent = MemberAgent(self.next_id(), self, username, password, member_id)
+                self.schedule.add(agent)
+            agent.member_id = member_id
+        agent.username = username
+        agent.password = password
+
+        self.users[username] = {'role': role, 'password': password, 'agent': agent, 'uri': uri}
+        self.user_uris[uri] = username
+
+    @instrument('authenticate')
     def authenticate_user(self, username, password):
-        for admin in self.graph.subjects(RDF.type, LIB.Admin):
-            if (str(self.graph.value(admin, LIB.username)) == username and 
-                str(self.graph.value(admin, LIB.password)) == password):
-                return "admin"
-        
-        for member in self.graph.subjects(RDF.type, LIB.Member):
-            if (str(self.graph.value(member, LIB.username)) == username and 
-                str(self.graph.value(member, LIB.password)) == password):
-                return "member"
+        user = self.users.get(username)
+        if user is not None and user['password'] == password:
+            return user['role']
         return None
 
+    def get_agent(self, username, role=None):
+        """Agent of a registered user, optionally only if it has the given role"""
+        user = self.users.get(username)
+        if user is None or (role is not None and user['role'] != role):
+            return None
+        return user['agent']
+
+    @instrument('search_book')
     def search_book(self, title):
-        book_details = {}
-        for book in self.graph.subjects(RDF.type, LIB.Book):
-            if str(self.graph.value(book, LIB.title)).lower() == title.lower():
-                book_details['title'] = str(self.graph.value(book, LIB.title))
-                book_details['ISBN'] = str(self.graph.value(book, LIB.ISBN))
-                book_details['author'] = str(self.graph.value(book, LIB.author))
-                book_details['year'] = str(self.graph.value(book, LIB.year))
-                book_details['isAvailable'] = str(self.graph.value(book, LIB.isAvailable))
-                book_details['uri'] = str(book)
-                return book_details
-        return None
+        # Results are cached per title and dropped when a book with that
+        # title is indexed or unindexed. Both happen under the write lock,
+        # so filling the cache under the read lock cannot store a stale result.
+        key = ('search_book', title.lower())
+        with self.lock.read_locked():
+            record = self.query_cache.get(key)
+            if record is MISSING:
+                uris = self.title_index.get(title.lower())
+                record = self.book_records[uris[0]] if uris else None
+                self.query_cache.put(key, record)
+            return record.as_dict() if record else None
+
+    def cache_stats(self):
+        """Hit, miss, eviction and invalidation counts of the query cache"""
+        return self.query_cache.stats()
+
+    @instrument('view_transactions')
+    def query_transactions(self, status=None, member_id=None, date_from=None, date_to=None):
+        """All transactions with their book and member details, optionally filtered.
+
+        Read from the transaction, book and member records without touching
+        the graph. Dates are ISO strings, so the borrow date range compares
+        as text.
+        """
+        if status != 'Active':
+            self.load_history(date_from, date_to)
+        key = ('query_transactions', status, member_id, date_from, date_to)
+        with self.lock.read_locked():
+            cached = self.query_cache.get(key, self.generation)
+            if cached is not MISSING:
+                return dict(cached)
+            transactions = {}
+            for record in self.transaction_records.values():
+                if status is not None and record.status != status:
+                    continue
+                if date_from is not None and record.borrow_date < date_from:
+                    continue
+                if date_to is not None and record.borrow_date > date_to:
+                    continue
+                details = self.transaction_details(record.uri)
+                if member_id is not None and details['member'].get('member_id') != member_id:
+                    continue
+                transactions[record.uri.split('#')[-1]] = details
+            self.query_cache.put(key, transactions, self.generation)
+            return dict(transactions)
+
+    def transaction_details(self, transaction):
+        """Book and member details of a single indexed transaction"""
+        record = self.transaction_records[str(transaction)]
+        book = self.book_records.get(record.book)
+        member = self.member_records.get(record.member)
+        return {
+            'borrow_date': record.borrow_date,
+            'due_date': str(record.due_date),
+            'status': record.status,
+            'book': book.summary() if book else {},
+            'member': member.as_dict() if member else {},
+        }
+
+    def member_record(self, member):
+        graph = self.graph
+        username = graph.value(member, LIB.username)
+        member_id = graph.value(member, LIB.memberID)
+        email = graph.value(member, LIB.email)
+        return MemberRecord(
+            text(member),
+            str(username) if username else 'Unknown',
+            str(member_id) if member_id else 'Unknown',
+            str(email) if email else 'Unknown',
+        )
+
+    def iter_transactions(self, cursor=None, descending=False, status=None, member_id=None,
+                          date_from=None, date_to=None, chunk_size=500):
+        """Yield (cursor, transaction_id, details) in borrow date order.
+
+        Only the transactions being yielded are resolved, so callers can
+        stream or page through any amount of history. The position is
+        re-located by key for every chunk, so transactions added while
+        iterating never cause duplicates or skips. Archived months are
+        loaded one at a time in iteration order, and only once a chunk
+        reaches them, so the first page loads just the months it shows.
+        """
+        load = status != 'Active'
+        key = decode_cursor(cursor) if cursor else None
+        if key is None:
+            if descending and date_to is not None:
+                key = (date_to + '\uffff',)
+            elif not descending and date_from is not None:
+                key = (date_from,)
+        while True:
+            position = key
+            # Resolve a chunk under the read lock, but never hold it across a yield
+            with self.lock.read_locked():
+                order = self.transaction_order
+                if descending:
+                    end = bisect_left(order, key) if key is not None else len(order)
+                    chunk = order[max(end - chunk_size, 0):end][::-1]
+                else:
+                    start = bisect_right(order, key) if key is not None else 0
+                    chunk = order[start:start + chunk_size]
+                rows = []
+                finished = not chunk
+                for key in chunk:
+                    borrow_date = key[0]
+                    if date_from is not None and borrow_date < date_from:
+                        if descending:
+                            finished = True
+                            break
+                        continue
+                    if date_to is not None and borrow_date > date_to:
+                        if not descending:
+                            finished = True
+                            break
+                        continue
+                    rows.append((key, self.transaction_details(key[1])))
+
+            if load:
+                # Months between the position and the end of a full chunk may
+                # hold rows that belong in it; past a short chunk, any month may
+                bound = chunk[-1][0] if len(chunk) == chunk_size else None
+                if descending:
+                    loaded = self.load_history(max(filter(None, (bound, date_from)), default=None),
+                                               position[0] if position is not None else date_to, newest=1)
+                else:
+                    loaded = self.load_history(position[0] if position is not None else date_from,
+                                               min(filter(None, (bound, date_to)), default=None), oldest=1)
+                if loaded:
+                    key = position
+                    continue
+
+            for row_key, details in rows:
+                if status is not None and details['status'] != status:
+                    continue
+                if member_id is not None and details['member'].get('member_id') != member_id:
+                    continue
+                yield encode_cursor(row_key), row_key[1].split('#')[-1], details
+            if finished:
+                return
+
+    def member_loans(self, member_uris, status=None, limit=None):
+        """A member's transactions, newest first, from the per-member index.
+
+        member_uris lists every URI the member's transactions may point at.
+        Cost depends on the member's own history, not on all transactions.
+        """
+        rows = self.collect_member_loans(member_uris, lambda details: status is None or details['status'] == status,
+                                         limit, load=status != 'Active')
+        return {key[1].split('#')[-1]: details for key, details in rows}
+
+    def member_history_page(self, member_uris, cursor=None, limit=50):
+        """One page of a member's finished loans, newest first, and the cursor of the next page.
+
+        cursor is the next cursor returned for the previous page. Active
+        loans are left out; member_loans(status='Active') lists them.
+        """
+        before = decode_cursor(cursor) if cursor else None
+        # One extra row tells whether there is a next page
+        rows = self.collect_member_loans(member_uris, lambda details: details['status'] != 'Active',
+                                         limit + 1, before)
+        page = {key[1].split('#')[-1]: details for key, details in rows[:limit]}
+        return page, encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+
+    def collect_member_loans(self, member_uris, include, limit=None, before=None, load=True):
+        """[(key, details)] of a member's loans older than before that include() accepts, newest first.
+
+        With load, archived months of the member's history are loaded newest
+        first and only until no unloaded month can hold a loan that belongs
+        in the result.
+        """
+        while True:
+            with self.lock.read_locked():
+                keys = sorted((key for uri in member_uris for key in self.member_transactions.get(str(uri), ())
+                               if before is None or key < before), reverse=True)
+                rows = []
+                for key in keys:
+                    details = self.transaction_details(key[1])
+                    if include(details):
+                        rows.append((key, details))
+                        if len(rows) == limit:
+                            break
+            if not load:
+                return rows
+            # A full result only needs months from its oldest loan on
+            date_from = rows[-1][0][0] if len(rows) == limit else None
+            if not self.load_history(date_from, before[0] if before else None, member_uris, newest=1):
+                return rows
+
+    def active_loan_count(self, member_uris):
+        with self.lock.read_locked():
+            return sum(self.active_loan_counts.get(str(uri), 0) for uri in member_uris)
+
+    def loans_due_between(self, start=None, end=None, limit=None):
+        """Active loans with start <= due date < end, earliest due first.
+
+        Dates are ISO strings. Bisecting the due date index costs O(log n)
+        and only the matching loans are resolved.
+        """
+        with self.lock.read_locked():
+            order = self.due_order
+            first = bisect_left(order, (start,)) if start is not None else 0
+            last = bisect_left(order, (end,)) if end is not None else len(order)
+            if limit is not None:
+                last = min(last, first + limit)
+            return {uri.split('#')[-1]: self.transaction_details(uri) for _, uri in order[first:last]}
+
+    def overdue_loans(self, as_of=None, limit=None):
+        """Active loans whose due date is before as_of (default: today)"""
+        as_of = as_of or datetime.date.today().isoformat()
+        return self.loans_due_between(end=as_of, limit=limit)
+
+    def loans_due_soon(self, days=7, as_of=None, limit=None):
+        """Active loans due from as_of (default: today) through the next days days"""
+        as_of = datetime.date.fromisoformat(as_of) if as_of else datetime.date.today()
+        end = as_of + datetime.timedelta(days=days + 1)
+        return self.loans_due_between(as_of.isoformat(), end.isoformat(), limit)
+
+    @instrument('overdue_sweep')
+    def sweep_overdue(self, as_of=None):
+        """Report overdue loans, for running on a schedule"""
+        overdue = self.overdue_loans(as_of)
+        metrics.inc('library_overdue_sweeps_total')
+        return overdue
+
+    @instrument('view_transactions')
+    def transactions_page(self, cursor=None, limit=50, **filters):
+        """One page of transactions and the cursor of the next page, if any.
+
+        Chunks of one page are resolved at a time, so only the archived
+        months the page reaches are loaded.
+        """
+        page = {}
+        next_cursor = None
+        for position, (item_cursor, transaction_id, details) in enumerate(
+                self.iter_transactions(cursor, chunk_size=limit + 1, **filters)):
+            if position == limit:
+                break
+            page[transaction_id] = details
+            next_cursor = item_cursor
+        else:
+            next_cursor = None
+        return page, next_cursor
+
+    def export_stream(self, format="jsonl", entity_type=None, changed_since=None):
+        """Yield an export of books, members and/or transactions line by line.
+
+        format is "ntriples", "jsonl" or "csv" (csv needs one entity_type);
+        changed_since is an ISO timestamp compared against modifiedAt.
+        Archived transactions are read partition by partition and streamed
+        without being loaded into the model.
+        """
+        from export import export_lines
+        return export_lines(self, format, entity_type, changed_since)
+
+    @instrument('search_books')
+    def search_books(self, query, page=1, per_page=20):
+        """Ranked, paginated full-text search over title, author and category"""
+        key = ('search_books', ' '.join(query.lower().split()), page, per_page)
+        with self.lock.read_locked():
+            cached = self.query_cache.get(key, self.catalog_generation)
+            if cached is MISSING:
+                cached = self.search_index.search(query, page, per_page)
+                self.query_cache.put(key, cached, self.catalog_generation)
+            uris, total = cached
+            return {
+                'results': [self.book_records[uri].as_dict() for uri in uris],
+                'total': total,
+                'page': page,
+                'per_page': per_page,
+            }
+
+    def suggest_titles(self, prefix, limit=10):
+        """Titles of the best matching books for a partially typed query"""
+        with self.lock.read_locked():
+            uris, _ = self.search_index.search(prefix, 1, limit)
+            return [self.book_records[uri].title for uri in uris]
+
+    def etag(self):
+        """Opaque tag that changes whenever the graph does.
+
+        The epoch is random per model instance, so tags handed out before a
+        restart never match the reloaded graph. With shared persistence the
+        tag is the journal position instead, which every synced worker agrees on.
+        """
+        if self.persistence.shared:
+            return self.persistence.position()
+        return f"{self.generation_epoch}-{self.generation}"
+
+    def get_book(self, book_uri):
+        with self.lock.read_locked():
+            record = self.book_records.get(str(book_uri))
+            return record.as_dict() if record else None
+
+    def search_by_isbn(self, isbn):
+        with self.lock.read_locked():
+            uris = self.isbn_index.get(normalize_isbn(isbn))
+            if not uris:
+                return None
+            return self.book_records[uris[0]].as_dict()
 
 class UserAgent(Agent):
     def __init__(self, unique_id, model, username, password):
@@ -93,127 +925,133 @@ class UserAgent(Agent):
     def authenticate(self):
         return self.model.authenticate_user(self.username, self.password)
 
+    def step(self):
+        if self.model.simulation is not None:
+            self.simulate(self.model.simulation)
+
+    def simulate(self, simulation):
+        pass
+
 class AdminAgent(UserAgent):
-    def add_book(self, title, isbn, author, year, category):
+    def simulate(self, simulation):
+        simulation.admin_step(self)
+
+    @instrument('add_book')
+    def add_book(self, title, isbn, author, year, category, durable=True, copies=1):
+        """Add a work, or more copies of the work already holding this ISBN"""
         try:
-            book_id = str(uuid.uuid4())
-            book_uri = URIRef(f"http://www.library-system.org/ontology#book_{book_id}")
-            
-            # Add book properties with proper datatypes
-            self.model.graph.add((book_uri, RDF.type, LIB.Book))
-            self.model.graph.add((book_uri, LIB.title, Literal(title)))
-            self.model.graph.add((book_uri, LIB.ISBN, Literal(isbn)))
-            self.model.graph.add((book_uri, LIB.author, Literal(author)))
-            self.model.graph.add((book_uri, LIB.year, Literal(year, datatype=XSD.integer)))
-            self.model.graph.add((book_uri, LIB.isAvailable, Literal('true', datatype=XSD.boolean)))
-            
-            category_uri = URIRef(f"http://www.library-system.org/ontology#category_{category.lower()}")
-            self.model.graph.add((book_uri, LIB.hasCategory, category_uri))
-            
-            return self.model.save_graph()
+            # Checked and added under the write lock, so a concurrent add or
+            # import of the same ISBN cannot create a second work
+            with self.model.write_section(), self.model.lock.write_locked():
+                existing = self.model.search_by_isbn(isbn)
+                if existing is None:
+                    self.model.apply_changes(added=book_triples(title, isbn, author, year, category, copies))
+            if existing is None:
+                return self.model.save_graph(durable)
+
+            book = URIRef(existing['uri'])
+            with self.model.book_locks(str(book)), self.model.write_section():
+                record = self.model.get_book(book)
+                if record is None:
+                    return False
+                self.model.apply_changes(
+                    removed=holding_patterns(book),
+                    added=holding_triples(book, record['copies'] + copies, record['available_copies'] + copies),
+                )
+            return self.model.save_graph(durable)
             
         except Exception as e:
             print(f"Error adding book: {e}")
             return False
 
-    def remove_book(self, book_uri):
+    @instrument('remove_book')
+    def remove_book(self, book_uri, durable=True):
         try:
-            for s, p, o in self.model.graph.triples((URIRef(book_uri), None, None)):
-                self.model.graph.remove((s, p, o))
-            return self.model.save_graph()
+            with self.model.book_locks(str(book_uri)):
+                self.model.apply_changes(removed=[(URIRef(book_uri), None, None)])
+            return self.model.save_graph(durable)
         except Exception as e:
             print(f"Error removing book: {e}")
             return False
 
-    def view_all_transactions(self):
+    def import_books(self, source, format=None, batch_size=5000):
+        """Bulk load books from a CSV or JSONL file, saving once at the end"""
+        from bulk_import import import_books
+        return import_books(self.model, source, format, batch_size)
+
+    def view_all_transactions(self, status=None, member_id=None, date_from=None, date_to=None):
         """View all transactions in the system with detailed information"""
-        transactions = {}
-        
-        # Query all transactions
-        for transaction in self.model.graph.subjects(RDF.type, LIB.Transaction):
-            transaction_id = str(transaction).split('#')[-1]
-            transactions[transaction_id] = {
-                'borrow_date': str(self.model.graph.value(transaction, LIB.borrowDate)),
-                'due_date': str(self.model.graph.value(transaction, LIB.dueDate)),
-                'status': str(self.model.graph.value(transaction, LIB.transactionStatus) or 'Unknown'),
-                'book': {},
-                'member': {}
-            }
-            
-            # Get book details
-            book = self.model.graph.value(transaction, LIB.involvesBook)
-            if book:
-                transactions[transaction_id]['book'] = {
-                    'title': str(self.model.graph.value(book, LIB.title)),
-                    'ISBN': str(self.model.graph.value(book, LIB.ISBN)),
-                    'author': str(self.model.graph.value(book, LIB.author))
-                }
-            
-            # Get member details - Updated method
-            member_uri = self.model.graph.value(transaction, LIB.hasTransaction)
-            if member_uri:
-                # Verify this is a member URI
-                if (member_uri, RDF.type, LIB.Member) in self.model.graph:
-                    username = self.model.graph.value(member_uri, LIB.username)
-                    member_id = self.model.graph.value(member_uri, LIB.memberID)
-                    email = self.model.graph.value(member_uri, LIB.email)
-                    
-                    transactions[transaction_id]['member'] = {
-                        'username': str(username) if username else 'Unknown',
-                        'member_id': str(member_id) if member_id else 'Unknown',
-                        'email': str(email) if email else 'Unknown'
-                    }
-        
-        return transactions
+        return self.model.query_transactions(status, member_id, date_from, date_to)
 
 class MemberAgent(UserAgent):
     def __init__(self, unique_id, model, username, password, member_id):
         super().__init__(unique_id, model, username, password)
         self.member_id = member_id
 
-    def borrow_book(self, book_uri):
+    def simulate(self, simulation):
+        simulation.member_step(self)
+
+    def member_uris(self):
+        """URI of this member, plus the member_<memberID> URI older borrows recorded"""
+        user = self.model.users.get(self.username)
+        uris = [URIRef(user['uri'])] if user else []
+        legacy = URIRef(f"http://www.library-system.org/ontology#member_{self.member_id}")
+        if legacy not in uris:
+            uris.append(legacy)
+        return uris
+
+    @instrument('borrow_book')
+    def borrow_book(self, book_uri, durable=True):
         try:
             book = URIRef(book_uri)
-            is_available = self.model.graph.value(book, LIB.isAvailable)
-            
-            if str(is_available).lower() != 'true':
-                return False, "Book is not available"
+            # Check and update availability atomically per book, so two members
+            # can never both see the same copy as available. The member lock
+            # keeps concurrent borrows by one member within the loan limit.
+            with self.model.member_locks(self.username), self.model.book_locks(str(book)), \
+                    self.model.write_section():
+                limit = self.model.max_active_loans
+                if limit is not None and self.model.active_loan_count(self.member_uris()) >= limit:
+                    return False, f"Loan limit reached ({limit} active loans)"
+                record = self.model.get_book(book)
+                if record is None or record['available_copies'] < 1:
+                    return False, "Book is not available"
+                member_uris = self.member_uris()
+                with self.model.lock.read_locked():
+                    if any((book, LIB.borrowedBy, uri) in self.model.graph for uri in member_uris):
+                        return False, "You already have this book on loan"
     
-            # Update book availability
-            self.model.graph.remove((book, LIB.isAvailable, None))
-            self.model.graph.add((book, LIB.isAvailable, Literal('false', datatype=XSD.boolean)))
-            
-            # Create new transaction
-            transaction_id = str(uuid.uuid4())
-            transaction_uri = URIRef(f"http://www.library-system.org/ontology#transaction_{transaction_id}")
+                # Create new transaction
+                transaction_id = str(uuid.uuid4())
+                transaction_uri = URIRef(f"http://www.library-system.org/ontology#transaction_{transaction_id}")
             
-            borrow_date = datetime.datetime.now()
-            due_date = borrow_date + datetime.timedelta(days=30)
+                borrow_date = datetime.datetime.now()
+                due_date = borrow_date + datetime.timedelta(days=self.model.loan_period_days)
             
-            # Format dates properly
-            borrow_date_str = borrow_date.strftime("%Y-%m-%d")
-            due_date_str = due_date.strftime("%Y-%m-%d")
+                # Format dates properly
+                borrow_date_str = borrow_date.strftime("%Y-%m-%d")
+                due_date_str = due_date.strftime("%Y-%m-%d")
             
-            # Create member URI
-            member_uri = URIRef(f"http://www.library-system.org/ontology#member_{self.member_id}")
+                member_uri = member_uris[0]
             
-            # Add transaction details
-            self.model.graph.add((transaction_uri, RDF.type, LIB.Transaction))
-            self.model.graph.add((transaction_uri, LIB.borrowDate, 
-                                Literal(borrow_date_str, datatype=XSD.date)))
-            self.model.graph.add((transaction_uri, LIB.dueDate, 
-                                Literal(due_date_str, datatype=XSD.date)))
-            self.model.graph.add((transaction_uri, LIB.involvesBook, book))
-            self.model.graph.add((transaction_uri, LIB.transactionStatus, Literal("Active")))
+                self.model.apply_changes(
+                    # Take one copy of the work
+                    removed=holding_patterns(book),
+                    added=holding_triples(book, record['copies'], record['available_copies'] - 1) + [
+                        # Add transaction details
+                        (transaction_uri, RDF.type, LIB.Transaction),
+                        (transaction_uri, LIB.borrowDate, Literal(borrow_date_str, datatype=XSD.date)),
+                        (transaction_uri, LIB.dueDate, Literal(due_date_str, datatype=XSD.date)),
+                        (transaction_uri, LIB.involvesBook, book),
+                        (transaction_uri, LIB.transactionStatus, Literal("Active")),
+                        # Add proper member associations
+                        (transaction_uri, LIB.hasTransaction, member_uri),
+                        (member_uri, LIB.hasTransaction, transaction_uri),
+                        # Add book-member association
+                        (book, LIB.borrowedBy, member_uri),
+                    ],
+                )
             
-            # Add proper member associations
-            self.model.graph.add((transaction_uri, LIB.hasTransaction, member_uri))
-            self.model.graph.add((member_uri, LIB.hasTransaction, transaction_uri))
-            
-            # Add book-member association
-            self.model.graph.add((book, LIB.borrowedBy, member_uri))
-            
-            if self.model.save_graph():
+            if self.model.save_graph(durable):
                 return True, "Book borrowed successfully"
             else:
                 return False, "Error saving transaction"
@@ -222,6 +1060,54 @@ class MemberAgent(UserAgent):
             print(f"Error in borrowing book: {e}")
             return False, f"Error borrowing book: {str(e)}"
 
+    def my_loans(self, status=None, limit=None):
+        """This member's transactions, newest first"""
+        return self.model.member_loans(self.member_uris(), status, limit)
+
+    def loan_history(self, cursor=None, limit=50):
+        """One page of this member's finished loans and the cursor of the next"""
+        return self.model.member_history_page(self.member_uris(), cursor, limit)
+
+    @instrument('return_book')
+    def return_book(self, book_uri, durable=True):
+        try:
+            book = URIRef(book_uri)
+            with self.model.book_locks(str(book)), self.model.write_section():
+                with self.model.lock.read_locked():
+                    graph = self.model.graph
+                    member_uris = self.member_uris()
+                    transaction = next((t for t in graph.subjects(LIB.involvesBook, book)
+                                        if str(graph.value(t, LIB.transactionStatus)) == 'Active'
+                                        and graph.value(t, LIB.hasTransaction) in member_uris), None)
+                    if transaction is None:
+                        return False, "You have no active loan for this book"
+                    member_uri = graph.value(transaction, LIB.hasTransaction)
+                record = self.model.get_book(book)
+
+                removed = [
+                    (transaction, LIB.transactionStatus, None),
+                    (book, LIB.borrowedBy, member_uri),
+                ]
+                added = [
+                    (transaction, LIB.transactionStatus, Literal("Returned")),
+                    (transaction, LIB.returnDate, Literal(datetime.date.today().isoformat(), datatype=XSD.date)),
+                ]
+                # The work may have been removed from the catalog while on loan
+                if record is not None:
+                    removed += holding_patterns(book)
+                    added += holding_triples(book, record['copies'],
+                                             min(record['available_copies'] + 1, record['copies']))
+                self.model.apply_changes(removed=removed, added=added)
+
+            if self.model.save_graph(durable):
+                return True, "Book returned successfully"
+            else:
+                return False, "Error saving transaction"
+
+        except Exception as e:
+            print(f"Error in returning book: {e}")
+            return False, f"Error returning book: {str(e)}"
+
 
 def run_library_system():
     library = LibraryModel()
@@ -241,15 +1127,13 @@ def run_library_system():
                 user_type = library.authenticate_user(username, password)
                 
                 if user_type == "admin":
-                    current_user = next((agent for agent in library.schedule.agents 
-                                     if isinstance(agent, AdminAgent) and agent.username == username), None)
+                    current_user = library.get_agent(username, "admin")
                     if current_user:
                         print("Logged in as Administrator")
                     else:
                         print("Error finding admin user")
                 elif user_type == "member":
-                    current_user = next((agent for agent in library.schedule.agents 
-                                     if isinstance(agent, MemberAgent) and agent.username == username), None)
+                    current_user = library.get_agent(username, "member")
                     if current_user:
                         print("Logged in as Member")
                     else:
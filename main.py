@@ -1,6 +1,6 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-from library_system import LibraryModel, AdminAgent, MemberAgent
+from library_system import LibraryModel
 
 class LibraryGUI:
     def __init__(self, root):
@@ -89,8 +89,7 @@ class LibraryGUI:
         user_type = self.library.authenticate_user(username, password)
         
         if user_type == "admin":
-            self.current_user = next((agent for agent in self.library.schedule.agents 
-                                    if isinstance(agent, AdminAgent) and agent.username == username), None)
+            self.current_user = self.library.get_agent(username, "admin")
             if self.current_user:
                 self.login_frame.destroy()
                 self.setup_admin_screen()
@@ -98,8 +97,7 @@ class LibraryGUI:
                 messagebox.showerror("Error", "Error finding admin user")
                 
         elif user_type == "member":
-            self.current_user = next((agent for agent in self.library.schedule.agents 
-                                    if isinstance(agent, MemberAgent) and agent.username == username), None)
+            self.current_user = self.library.get_agent(username, "member")
             if self.current_user:
                 self.login_frame.destroy()
                 self.setup_member_screen()
@@ -0,0 +1,103 @@
+"""Command line maintenance tasks for the library ontology"""
+import argparse
+import json
+import sys
+
+from library_system import RDF_PATH, AdminAgent, LibraryModel, utc_timestamp
+
+
+def import_books_command(library, args):
+    admin = AdminAgent(library.next_id(), library, "cli", "")
+    report = admin.import_books(args.file, args.format, args.batch_size)
+    print(f"Rows read:  {report['rows']}")
+    print(f"Imported:   {report['imported']}")
+    print(f"Duplicates: {report['duplicates']}")
+    print(f"Failed:     {report['failed']}")
+    for line_number, message in report['errors']:
+        print(f"  line {line_number}: {message}")
+    return 0 if report['saved'] else 1
+
+
+def export_command(library, args):
+    watermark = utc_timestamp()
+    output = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        for line in library.export_stream(args.format, args.type, args.changed_since):
+            output.write(line)
+    finally:
+        if args.output:
+            output.close()
+    # Pass this as --changed-since next time to export only newer changes
+    print(f"Watermark: {watermark}", file=sys.stderr)
+    return 0
+
+
+def compact_command(library, args):
+    if library.compact():
+        print("Journal compacted")
+        return 0
+    print("Nothing to compact for this persistence mode")
+    return 1
+
+
+def sweep_overdue_command(library, args):
+    """Print overdue loans as JSON lines; meant to be run from cron"""
+    overdue = library.sweep_overdue(args.as_of)
+    for transaction_id, details in overdue.items():
+        print(json.dumps(dict(details, id=transaction_id)))
+    print(f"{len(overdue)} overdue loans", file=sys.stderr)
+    return 0
+
+
+def migrate_holdings_command(library, args):
+    works, duplicates = library.migrate_holdings()
+    if works and not library.save_graph():
+        return 1
+    print(f"Merged {duplicates} duplicate books into {works} works")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rdf-path', default=RDF_PATH)
+    parser.add_argument('--persistence', default='snapshot',
+                        help="snapshot, journal, shared, sqlite or partitioned (default: snapshot)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_books = commands.add_parser('import-books', help="Bulk load books from a CSV or JSONL file")
+    import_books.add_argument('file')
+    import_books.add_argument('--format', choices=['csv', 'jsonl'])
+    import_books.add_argument('--batch-size', type=int, default=5000)
+    import_books.set_defaults(handler=import_books_command)
+
+    export = commands.add_parser('export', help="Stream books, members and transactions to a file")
+    export.add_argument('--format', choices=['ntriples', 'jsonl', 'csv'], default='jsonl')
+    export.add_argument('--type', choices=['book', 'member', 'transaction'])
+    export.add_argument('--changed-since', help="Only entities modified at or after this ISO timestamp")
+    export.add_argument('--output', '-o', help="Output file (default: stdout)")
+    export.set_defaults(handler=export_command)
+
+    compact = commands.add_parser('compact', help="Fold the mutation journal into the ontology file")
+    compact.set_defaults(handler=compact_command)
+
+    sweep = commands.add_parser('sweep-overdue', help="List active loans that are past their due date")
+    sweep.add_argument('--as-of', help="ISO date to check against (default: today)")
+    sweep.set_defaults(handler=sweep_overdue_command)
+
+    migrate = commands.add_parser('migrate-holdings',
+                                  help="Merge books sharing an ISBN into one work with several copies")
+    migrate.set_defaults(handler=migrate_holdings_command)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    library = LibraryModel(rdf_path=args.rdf_path, persistence=args.persistence)
+    try:
+        return args.handler(library, args)
+    finally:
+        library.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,157 @@
+from bisect import bisect_left
+from functools import wraps
+import os
+import threading
+import time
+
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DESCRIPTIONS = {
+    'library_operation_seconds': ('histogram', 'Latency of LibraryModel operations'),
+    'library_operation_errors_total': ('counter', 'LibraryModel operations that raised'),
+    'library_save_bytes_total': ('counter', 'Bytes written to storage by graph saves'),
+    'library_overdue_sweeps_total': ('counter', 'Completed overdue loan sweeps'),
+    'library_writes_rejected_total': ('counter', 'Writes refused because the write queue was full'),
+    'library_history_partitions_loaded_total': ('counter', 'Archived transaction partitions loaded on demand'),
+    'http_request_seconds': ('histogram', 'Latency of Flask requests until the response is returned'),
+    'http_requests_total': ('counter', 'Flask requests by route, method and status'),
+}
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Counters and latency histograms rendered in Prometheus text format.
+
+    Recording is skipped entirely while the registry is disabled, so
+    instrumented code only pays for one attribute check.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def render(self):
+        """All recorded metrics as Prometheus text exposition format"""
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (list(h.counts), h.sum, h.count, h.buckets))
+                                for key, h in self.histograms.items())
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name in described:
+                return
+            described.add(name)
+            kind, text = DESCRIPTIONS.get(name, (kind, name))
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name, 'counter')
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), (counts, total, count, buckets) in histograms:
+            describe(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry; set LIBRARY_METRICS=0 to turn recording off
+REGISTRY = MetricsRegistry(enabled=os.environ.get('LIBRARY_METRICS', '1') != '0')
+
+
+def instrument(operation):
+    """Record the latency and failures of a model operation"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not REGISTRY.enabled:
+                return f(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            except Exception:
+                REGISTRY.inc('library_operation_errors_total', operation=operation)
+                raise
+            finally:
+                REGISTRY.observe('library_operation_seconds', time.perf_counter() - started,
+                                 operation=operation)
+        return decorated_function
+    return decorator
+
+
+def instrument_stream(operation, rows):
+    """Yield rows, recording the latency and failures of the whole stream.
+
+    A decorator only times a generator's creation, so streamed responses
+    wrap the iterator instead and are timed until it is exhausted or closed.
+    """
+    if not REGISTRY.enabled:
+        yield from rows
+        return
+    started = time.perf_counter()
+    try:
+        yield from rows
+    except Exception:
+        REGISTRY.inc('library_operation_errors_total', operation=operation)
+        raise
+    finally:
+        REGISTRY.observe('library_operation_seconds', time.perf_counter() - started,
+                         operation=operation)
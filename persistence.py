@@ -0,0 +1,689 @@
+from collections import defaultdict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from rdflib import RDF, Graph, Literal
+from rdflib.plugins.serializers.nt import _nt_row
+from sqlite_store import SQLiteStore
+import fcntl
+import hashlib
+import itertools
+import json
+import pickle
+import rdflib
+import threading
+import time
+import os
+
+
+def write_snapshot(graph, path):
+    """Serialize the graph to a temporary file and atomically move it into place.
+
+    Returns the number of bytes written.
+    """
+    tmp_path = f"{path}.tmp"
+    graph.serialize(destination=tmp_path, format="pretty-xml", encoding="utf-8")
+    size = os.path.getsize(tmp_path)
+    os.replace(tmp_path, path)
+    return size
+
+
+def file_digest(path):
+    """SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_journal(lines):
+    """Yield (op, triple) for each complete +/- line of an N-Triples journal"""
+    # A line without a trailing newline is a torn write from a crash
+    lines = (line for line in lines if line.endswith("\n") and line[:1] in "+-")
+    for op, rows in itertools.groupby(lines, key=lambda line: line[0]):
+        batch = Graph()
+        batch.parse(data="".join(row[2:] for row in rows), format="nt")
+        for triple in batch:
+            yield op, triple
+
+
+def replay_file(path, graph):
+    """Apply an N-Triples change log to graph, returning the number of changes"""
+    if not os.path.exists(path):
+        return 0
+    applied = 0
+    with open(path, encoding="utf-8") as log:
+        for op, triple in parse_journal(log):
+            if op == "+":
+                graph.add(triple)
+            else:
+                graph.remove(triple)
+            applied += 1
+    return applied
+
+
+def append_changes(path, changes):
+    """Durably append (op, triple) changes to an N-Triples change log"""
+    data = "".join(f"{op} {_nt_row(triple)}" for op, triple in changes).encode("utf-8")
+    with open(path, "ab") as log:
+        log.write(data)
+        log.flush()
+        os.fsync(log.fileno())
+    return len(data)
+
+
+class MemoryPersistence:
+    """Keeps the graph in memory only, for benchmarks and simulations"""
+
+    needs_snapshot = False
+    shared = False
+    graph_lock = None
+
+    def __init__(self, rdf_path=None, graph=None, snapshot_cache=False):
+        self.graph = graph
+
+    def load(self):
+        return self.graph if self.graph is not None else Graph()
+
+    def persist(self, graph, changes):
+        pass
+
+    def should_compact(self):
+        return False
+
+
+class SnapshotPersistence:
+    """Rewrites the whole ontology file on every save.
+
+    With snapshot_cache enabled the parsed graph is also pickled next to the
+    ontology file, keyed by the file's size, modification time and SHA-256
+    digest, so later starts can skip the RDF/XML parse until the file
+    changes. The digest is only computed when size and time match.
+    """
+
+    # persist() serializes the whole graph, so it needs a consistent copy
+    needs_snapshot = True
+    # Whether other processes write to the same storage
+    shared = False
+    # Model lock held while persist() runs: None, "read" or "write"
+    graph_lock = None
+
+    def __init__(self, rdf_path, snapshot_cache=False):
+        self.rdf_path = rdf_path
+        self.cache_path = f"{os.path.splitext(rdf_path)[0]}.cache" if snapshot_cache else None
+
+    def load(self):
+        """Load the ontology file into a new graph"""
+        graph = self.load_cache()
+        if graph is not None:
+            return graph
+        graph = Graph()
+        try:
+            graph.parse(self.rdf_path, format="xml")
+        except Exception as e:
+            print(f"Warning: {e}. Creating new graph.")
+            return graph
+        self.write_cache(graph)
+        return graph
+
+    def cache_key(self):
+        stat = os.stat(self.rdf_path)
+        return (rdflib.__version__, stat.st_size, stat.st_mtime_ns)
+
+    def load_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, "rb") as cache:
+                key, digest = pickle.load(cache)
+                # Size and time can match after an edit, e.g. a copy preserving mtime
+                if key != self.cache_key() or digest != file_digest(self.rdf_path):
+                    return None
+                return pickle.load(cache)
+        except Exception as e:
+            print(f"Warning: ignoring snapshot cache: {e}")
+            return None
+
+    def write_cache(self, graph):
+        if not self.cache_path:
+            return
+        try:
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, "wb") as cache:
+                pickle.dump((self.cache_key(), file_digest(self.rdf_path)), cache,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(graph, cache, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            print(f"Warning: could not write snapshot cache: {e}")
+
+    def persist(self, graph, changes):
+        return write_snapshot(graph, self.rdf_path)
+
+    def should_compact(self):
+        return False
+
+
+class JournalPersistence(SnapshotPersistence):
+    """Appends each mutation to an N-Triples journal with +/- markers.
+
+    The ontology file is only rewritten on compaction, which folds the
+    journal into a new snapshot and truncates it.
+    """
+
+    needs_snapshot = False
+
+    def __init__(self, rdf_path, journal_path=None, compact_threshold=8 * 1024 * 1024,
+                 snapshot_cache=False):
+        super().__init__(rdf_path, snapshot_cache)
+        self.journal_path = journal_path or f"{os.path.splitext(rdf_path)[0]}.journal.nt"
+        self.compact_threshold = compact_threshold
+
+    def load(self):
+        graph = super().load()
+        self.replay(graph)
+        return graph
+
+    def replay(self, graph):
+        """Apply the journal on top of the snapshot already loaded into graph"""
+        return replay_file(self.journal_path, graph)
+
+    def persist(self, graph, changes):
+        if not changes:
+            return 0
+        return append_changes(self.journal_path, changes)
+
+    def should_compact(self):
+        return os.path.getsize(self.journal_path) >= self.compact_threshold
+
+    def compact(self, graph):
+        """Fold the journal into a new snapshot of the ontology file"""
+        write_snapshot(graph, self.rdf_path)
+        self.write_cache(graph)
+        # Replaying a stale journal over the new snapshot is harmless, so a
+        # crash between these two steps loses nothing
+        open(self.journal_path, "w").close()
+
+
+class SharedJournalPersistence(JournalPersistence):
+    """Journal shared by several worker processes on one host.
+
+    Appends happen under an exclusive flock on a lock file, and each
+    process remembers how far into the journal it has read, so
+    read_changes() returns only what other processes appended since.
+    Compaction swaps in a new, empty journal file instead of truncating:
+    a process still reading the old file finishes its tail first.
+    """
+
+    shared = True
+
+    def __init__(self, rdf_path, journal_path=None, compact_threshold=8 * 1024 * 1024,
+                 snapshot_cache=False):
+        super().__init__(rdf_path, journal_path, compact_threshold, snapshot_cache)
+        self.lock_file = open(f"{self.journal_path}.lock", "ab")
+        # flock is held per process; threads take turns through this lock
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.journal = None
+        self.offset = 0
+
+    @contextmanager
+    def locked(self):
+        """Hold the cross-process journal lock; reentrant within a thread"""
+        with self.thread_lock:
+            if self.depth == 0:
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+            self.depth += 1
+            try:
+                yield
+            finally:
+                self.depth -= 1
+                if self.depth == 0:
+                    fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    def load(self):
+        with self.locked():
+            graph = SnapshotPersistence.load(self)
+            self.open_journal()
+            for op, triple in self.read_changes():
+                if op == "+":
+                    graph.add(triple)
+                else:
+                    graph.remove(triple)
+        return graph
+
+    def open_journal(self):
+        open(self.journal_path, "ab").close()
+        if self.journal is not None:
+            self.journal.close()
+        self.journal = open(self.journal_path, "rb")
+        self.offset = 0
+
+    def has_changes(self):
+        """Cheap unlocked check for journal data this process has not read"""
+        stat = os.stat(self.journal_path)
+        return stat.st_ino != os.fstat(self.journal.fileno()).st_ino or stat.st_size > self.offset
+
+    def position(self):
+        """Journal file and offset read up to, as an opaque string"""
+        return f"{os.fstat(self.journal.fileno()).st_ino:x}-{self.offset}"
+
+    def read_changes(self):
+        """(op, triple) changes appended since the last call; caller holds locked()"""
+        changes = []
+        while True:
+            self.journal.seek(self.offset)
+            data = self.journal.read()
+            end = data.rfind(b"\n") + 1
+            self.offset += end
+            changes.extend(parse_journal(data[:end].decode("utf-8").splitlines(keepends=True)))
+            # Once the old journal is read to the end, follow a compaction to the new one
+            if os.stat(self.journal_path).st_ino == os.fstat(self.journal.fileno()).st_ino:
+                return changes
+            self.open_journal()
+
+    def persist(self, graph, changes):
+        if not changes:
+            return 0
+        data = "".join(f"{op} {_nt_row(triple)}" for op, triple in changes).encode("utf-8")
+        with self.locked():
+            with open(self.journal_path, "ab") as journal:
+                start = journal.tell()
+                journal.write(data)
+                journal.flush()
+                os.fsync(journal.fileno())
+                current = os.fstat(journal.fileno()).st_ino == os.fstat(self.journal.fileno()).st_ino
+            # Skip our own changes unless other processes' changes are still unread before them
+            if current and start == self.offset:
+                self.offset += len(data)
+        return len(data)
+
+    def compact(self, graph):
+        """Snapshot graph, which must include every journaled change, and start a new journal"""
+        with self.locked():
+            write_snapshot(graph, self.rdf_path)
+            self.write_cache(graph)
+            tmp_path = f"{self.journal_path}.tmp"
+            open(tmp_path, "wb").close()
+            os.replace(tmp_path, self.journal_path)
+            self.open_journal()
+
+
+# Partitions the indexes are built from, loaded at startup
+HOT_PARTITIONS = ("schema", "users", "catalog", "active")
+ARCHIVE_PREFIX = "archive-"
+# Change log of the archive partitions holding each member's loans
+MEMBERS_LOG = "members"
+
+
+class PartitionedPersistence:
+    """Stores the ontology as separately loaded and saved partitions.
+
+    Triples are split into schema, users, catalog, active transactions and
+    finished transactions archived by borrow month. The hot partitions are
+    loaded at startup; an archive month is loaded only when load_partition()
+    asks for it. A manifest records which months hold each member's loans,
+    so a member's history loads only those. Each partition is an N-Triples
+    change log like the journal, so a save appends to just the partitions
+    it touches. A transaction whose status changes moves to its new
+    partition as a whole. On first use the partitions are seeded from the
+    ontology file.
+    """
+
+    needs_snapshot = False
+    shared = False
+    # Changes are routed to partitions by route(), under the write lock
+    graph_lock = None
+
+    def __init__(self, rdf_path, directory=None, compact_threshold=1024 * 1024, snapshot_cache=False):
+        # Imported here: library_system imports this module
+        from library_system import LIB
+        self.lib = LIB
+        self.rdf_path = rdf_path
+        self.directory = directory or f"{os.path.splitext(rdf_path)[0]}.partitions"
+        self.compact_threshold = compact_threshold
+        self.loaded = set()
+        # Member URI -> names of the archive partitions holding its loans
+        self.members = {}
+
+    def path(self, name):
+        return os.path.join(self.directory, f"{name}.nt")
+
+    def load(self):
+        if not os.path.isdir(self.directory):
+            return self.seed()
+        graph = Graph()
+        namespaces_path = os.path.join(self.directory, "namespaces.json")
+        if os.path.exists(namespaces_path):
+            with open(namespaces_path, encoding="utf-8") as f:
+                for prefix, namespace in json.load(f).items():
+                    graph.bind(prefix, namespace)
+        for name in HOT_PARTITIONS:
+            replay_file(self.path(name), graph)
+            self.loaded.add(name)
+        manifest = Graph()
+        replay_file(self.path(MEMBERS_LOG), manifest)
+        for member, _, name in manifest:
+            self.members.setdefault(str(member), set()).add(str(name))
+        return graph
+
+    def seed(self):
+        """Split the ontology file into partitions, keeping everything loaded"""
+        graph = Graph()
+        try:
+            graph.parse(self.rdf_path, format="xml")
+        except Exception as e:
+            print(f"Warning: {e}. Creating new graph.")
+        os.makedirs(self.directory)
+        with open(os.path.join(self.directory, "namespaces.json"), "w", encoding="utf-8") as f:
+            json.dump({prefix: str(namespace) for prefix, namespace in graph.namespaces()}, f, indent=2)
+        partitions = self.split(graph, graph)
+        for transaction in graph.subjects(RDF.type, self.lib.Transaction):
+            name = self.partition(graph, transaction)
+            partitions[MEMBERS_LOG].extend(triple for _, triple in self.archived(graph, transaction, name))
+        for name, triples in partitions.items():
+            append_changes(self.path(name), [("+", triple) for triple in triples])
+        self.loaded.update(HOT_PARTITIONS, self.archives())
+        return graph
+
+    def archives(self):
+        """Names of the archive partitions on disk, oldest month first"""
+        return sorted(name[:-3] for name in os.listdir(self.directory)
+                      if name.startswith(ARCHIVE_PREFIX) and name.endswith(".nt"))
+
+    def unloaded(self, date_from=None, date_to=None, members=None):
+        """Archive partitions not loaded yet whose borrow month overlaps the date range.
+
+        members limits them to the partitions holding loans of those member URIs.
+        """
+        names = self.archives()
+        if members is not None:
+            names = sorted(set().union(*(self.members.get(str(member), ()) for member in members)))
+        unloaded = []
+        for name in names:
+            month = name[len(ARCHIVE_PREFIX):]
+            if name in self.loaded:
+                continue
+            if month == "unknown":
+                # Loans without a borrow date sort after every dated one
+                if date_to is None:
+                    unloaded.append(name)
+                continue
+            if (date_from is None or month >= date_from[:7]) and (date_to is None or month <= date_to[:7]):
+                unloaded.append(name)
+        return unloaded
+
+    def read_partition(self, name):
+        """Triples of one partition, without counting it as loaded"""
+        graph = Graph()
+        replay_file(self.path(name), graph)
+        return graph
+
+    def load_partition(self, name):
+        """Triples of one partition, which counts as loaded from now on"""
+        graph = self.read_partition(name)
+        self.loaded.add(name)
+        return graph
+
+    def entity(self, graph, triple, removed_transactions=()):
+        """The subject whose partition a triple is stored in"""
+        subject, predicate, obj = triple
+        # Member to transaction links are stored with the transaction
+        if predicate == self.lib.hasTransaction and (
+                obj in removed_transactions or (obj, RDF.type, self.lib.Transaction) in graph):
+            return obj
+        return subject
+
+    def transaction_partition(self, graph, transaction, status):
+        if str(status) == "Active":
+            return "active"
+        borrow_date = graph.value(transaction, self.lib.borrowDate)
+        return ARCHIVE_PREFIX + (str(borrow_date)[:7] if borrow_date is not None else "unknown")
+
+    def partition(self, graph, entity, removed_types=()):
+        lib = self.lib
+        types = set(graph.objects(entity, RDF.type)) | set(removed_types)
+        if lib.Transaction in types:
+            return self.transaction_partition(graph, entity, graph.value(entity, lib.transactionStatus))
+        if lib.Book in types:
+            return "catalog"
+        if lib.Member in types or lib.Admin in types:
+            return "users"
+        return "schema"
+
+    def archived(self, graph, transaction, name):
+        """Manifest changes recording that a transaction's member has loans in partition name"""
+        if not name.startswith(ARCHIVE_PREFIX):
+            return []
+        member = graph.value(transaction, self.lib.hasTransaction)
+        if member is None:
+            return []
+        names = self.members.setdefault(str(member), set())
+        if name in names:
+            return []
+        names.add(name)
+        return [("+", (member, self.lib.archivedIn, Literal(name)))]
+
+    def split(self, graph, triples):
+        """Group triples by partition"""
+        partitions = defaultdict(list)
+        names = {}
+        for triple in triples:
+            entity = self.entity(graph, triple)
+            if entity not in names:
+                names[entity] = self.partition(graph, entity)
+            partitions[names[entity]].append(triple)
+        return partitions
+
+    def route(self, graph, changes):
+        """Tag (op, triple) changes with the partition each is saved to, as (op, triple, name).
+
+        Runs under the model's write lock right after the changes are
+        applied, so graph holds exactly their result.
+        """
+        lib = self.lib
+        removed_types = defaultdict(set)
+        previous = {}
+        for op, (subject, predicate, obj) in changes:
+            if op == "-" and predicate == RDF.type:
+                removed_types[subject].add(obj)
+            if op == "-" and predicate == lib.transactionStatus:
+                previous[subject] = self.transaction_partition(graph, subject, obj)
+
+        removed_transactions = {subject for subject, types in removed_types.items() if lib.Transaction in types}
+        by_entity = defaultdict(list)
+        for op, triple in changes:
+            by_entity[self.entity(graph, triple, removed_transactions)].append((op, triple))
+        routed = []
+        for entity, entity_changes in by_entity.items():
+            name = self.partition(graph, entity, removed_types[entity])
+            routed.extend((op, triple, MEMBERS_LOG) for op, triple in self.archived(graph, entity, name))
+            old_name = previous.get(entity, name)
+            if old_name == name:
+                routed.extend((op, triple, name) for op, triple in entity_changes)
+                continue
+            # Move the whole transaction: drop its old triples, write its current ones
+            current = set(graph.triples((entity, None, None))) | set(graph.triples((None, lib.hasTransaction, entity)))
+            added = {triple for op, triple in entity_changes if op == "+"}
+            removed = {triple for op, triple in entity_changes if op == "-"}
+            routed.extend(("-", triple, old_name) for triple in (current - added) | removed)
+            routed.extend(("+", triple, name) for triple in current)
+        return routed
+
+    def persist(self, graph, changes):
+        """Append changes tagged by route() to their partitions"""
+        partitions = defaultdict(list)
+        for op, triple, name in changes:
+            partitions[name].append((op, triple))
+        written = 0
+        # The manifest, then archives: a crash mid-move then leaves a
+        # transaction in both partitions rather than in neither
+        order = lambda name: (name != MEMBERS_LOG, name in HOT_PARTITIONS)
+        for name in sorted(partitions, key=order):
+            written += append_changes(self.path(name), partitions[name])
+        return written
+
+    def should_compact(self):
+        return any(os.path.exists(self.path(name)) and os.path.getsize(self.path(name)) >= self.compact_threshold
+                   for name in HOT_PARTITIONS)
+
+    def compact(self, graph):
+        """Rewrite the hot partitions as plain snapshots of their current triples"""
+        partitions = self.split(graph, graph)
+        for name in HOT_PARTITIONS:
+            tmp_path = f"{self.path(name)}.tmp"
+            open(tmp_path, "wb").close()
+            append_changes(tmp_path, [("+", triple) for triple in partitions.get(name, ())])
+            os.replace(tmp_path, self.path(name))
+
+
+class SQLitePersistence:
+    """Keeps the graph in a SQLite database instead of in memory.
+
+    Mutations are written to the database as they happen and save_graph
+    commits them as one SQLite transaction. On first use an empty database
+    is seeded from the ontology file.
+    """
+
+    needs_snapshot = False
+    shared = False
+    # persist() commits the live store, so no mutation may be half applied
+    graph_lock = "write"
+
+    def __init__(self, rdf_path, db_path=None, snapshot_cache=False):
+        # snapshot_cache does not apply: the database is the fast start path
+        self.rdf_path = rdf_path
+        self.db_path = db_path or f"{os.path.splitext(rdf_path)[0]}.sqlite3"
+
+    def load(self):
+        graph = Graph(store=SQLiteStore(self.db_path))
+        if len(graph) == 0 and os.path.exists(self.rdf_path):
+            seed = Graph()
+            try:
+                seed.parse(self.rdf_path, format="xml")
+            except Exception as e:
+                print(f"Warning: {e}. Creating new graph.")
+            for prefix, namespace in seed.namespaces():
+                graph.bind(prefix, namespace)
+            graph.addN((s, p, o, graph) for s, p, o in seed)
+            graph.commit()
+        return graph
+
+    def persist(self, graph, changes):
+        graph.commit()
+
+    def should_compact(self):
+        return False
+
+
+class GroupCommitFlusher:
+    """Background thread that persists queued saves in batches.
+
+    Each save_graph call enqueues a Future; the flusher wakes up once per
+    interval, or as soon as batch_size saves are waiting, persists all
+    pending changes with a single flush and resolves every queued Future.
+    """
+
+    def __init__(self, flush, interval=0.05, batch_size=64):
+        self.flush = flush
+        self.interval = interval
+        self.batch_size = batch_size
+        self.condition = threading.Condition()
+        self.waiting = []
+        self.running = True
+        self.stats = {
+            'flushes': 0,
+            'saves': 0,
+            'failed_flushes': 0,
+            'last_batch_size': 0,
+            'max_batch_size': 0,
+            'total_flush_seconds': 0.0,
+            'last_flush_seconds': 0.0,
+            'max_flush_seconds': 0.0,
+        }
+        self.thread = threading.Thread(target=self._run, name="group-commit-flusher", daemon=True)
+        self.thread.start()
+
+    def submit(self):
+        """Queue a save and return a Future resolved once it is durable"""
+        future = Future()
+        with self.condition:
+            if not self.running:
+                raise RuntimeError("Group commit flusher is stopped")
+            self.waiting.append(future)
+            if len(self.waiting) in (1, self.batch_size):
+                self.condition.notify()
+        return future
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.waiting:
+                    self.condition.wait()
+                # Give concurrent saves one interval to join the batch
+                if self.running and len(self.waiting) < self.batch_size:
+                    self.condition.wait(self.interval)
+                batch, self.waiting = self.waiting, []
+                running = self.running
+            if batch:
+                self._flush_batch(batch)
+            if not running:
+                return
+
+    def _flush_batch(self, batch):
+        started = time.perf_counter()
+        try:
+            ok = self.flush()
+        except Exception as e:
+            print(f"Error in group commit flush: {e}")
+            ok = False
+        elapsed = time.perf_counter() - started
+
+        with self.condition:
+            stats = self.stats
+            stats['flushes'] += 1
+            stats['saves'] += len(batch)
+            stats['failed_flushes'] += 0 if ok else 1
+            stats['last_batch_size'] = len(batch)
+            stats['max_batch_size'] = max(stats['max_batch_size'], len(batch))
+            stats['total_flush_seconds'] += elapsed
+            stats['last_flush_seconds'] = elapsed
+            stats['max_flush_seconds'] = max(stats['max_flush_seconds'], elapsed)
+
+        for future in batch:
+            future.set_result(ok)
+
+    def get_stats(self):
+        with self.condition:
+            stats = dict(self.stats)
+        flushes = stats['flushes'] or 1
+        stats['avg_batch_size'] = stats['saves'] / flushes
+        stats['avg_flush_seconds'] = stats['total_flush_seconds'] / flushes
+        return stats
+
+    def stop(self):
+        """Flush anything still queued and stop the background thread"""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join()
+
+
+PERSISTENCE_MODES = {
+    "memory": MemoryPersistence,
+    "snapshot": SnapshotPersistence,
+    "journal": JournalPersistence,
+    "shared": SharedJournalPersistence,
+    "partitioned": PartitionedPersistence,
+    "sqlite": SQLitePersistence,
+}
+
+
+def make_persistence(mode, rdf_path, **options):
+    """Build a persistence strategy from its name, or pass an instance through"""
+    if not isinstance(mode, str):
+        return mode
+    try:
+        return PERSISTENCE_MODES[mode](rdf_path, **options)
+    except KeyError:
+        raise ValueError(f"Unknown persistence mode: {mode}")
@@ -0,0 +1,82 @@
+"""Slotted read model of the books, members and transactions in the graph.
+
+Hot reads are answered from these records instead of rdflib lookups. The
+records are rebuilt from the graph whenever an entity changes, and values
+that repeat across entities (URIs, dates, statuses, authors) are interned
+so every index shares one string object per value.
+"""
+from sys import intern
+
+
+def text(value):
+    """Interned str() of an rdflib term"""
+    return intern(str(value))
+
+
+def optional_text(value):
+    """Interned str() of an rdflib term, keeping None for a missing one"""
+    return intern(str(value)) if value is not None else None
+
+
+class BookRecord:
+    __slots__ = ('uri', 'title', 'isbn', 'author', 'year', 'copies', 'available_copies')
+
+    def __init__(self, uri, title, isbn, author, year, copies, available_copies):
+        self.uri = uri
+        self.title = title
+        self.isbn = isbn
+        self.author = author
+        self.year = year
+        self.copies = copies
+        self.available_copies = available_copies
+
+    def as_dict(self):
+        """The book as handed to callers and templates"""
+        return {
+            'title': self.title,
+            'ISBN': self.isbn,
+            'author': self.author,
+            'year': self.year,
+            'isAvailable': 'true' if self.available_copies > 0 else 'false',
+            'copies': self.copies,
+            'available_copies': self.available_copies,
+            'uri': self.uri,
+        }
+
+    def summary(self):
+        """The book as shown in transaction listings"""
+        return {'title': self.title, 'ISBN': self.isbn, 'author': self.author}
+
+
+class MemberRecord:
+    __slots__ = ('uri', 'username', 'member_id', 'email')
+
+    def __init__(self, uri, username, member_id, email):
+        self.uri = uri
+        self.username = username
+        self.member_id = member_id
+        self.email = email
+
+    def as_dict(self):
+        return {'username': self.username, 'member_id': self.member_id, 'email': self.email}
+
+
+class TransactionRecord:
+    __slots__ = ('uri', 'borrow_date', 'due_date', 'status', 'book', 'member')
+
+    def __init__(self, uri, borrow_date, due_date, status, book, member):
+        self.uri = uri
+        self.borrow_date = borrow_date
+        self.due_date = due_date
+        self.status = status
+        self.book = book
+        self.member = member
+
+    @property
+    def active(self):
+        return self.status == 'Active'
+
+    @property
+    def key(self):
+        """Position in the borrow date ordered transaction index"""
+        return (self.borrow_date, self.uri)
@@ -0,0 +1,329 @@
+from bisect import bisect_left, insort
+import heapq
+import re
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Relative weight of a query term matching in each indexed field
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'author': 2.0,
+    'category': 1.0,
+}
+
+EXACT_WEIGHT = 1.0
+PREFIX_WEIGHT = 0.8
+FUZZY_WEIGHT = 0.6
+FUZZY_THRESHOLD = 0.4
+MAX_EXPANSIONS = 50
+# Rarest term postings up to which every match is scored and counted exactly
+MAX_COUNT = 1000
+# Unsorted additions a tier holds before they are folded into its sorted ids
+PENDING_LIMIT = 64
+# Tolerance when comparing summed float scores
+EPSILON = 1e-9
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Tier:
+    """Ids of the documents a term scores the same in, in sorted order.
+
+    Additions are parked unsorted and folded in once there are more of
+    them than PENDING_LIMIT and the sorted ids, so bulk indexing does not
+    pay for a sorted insert per document.
+    """
+
+    __slots__ = ('docs', 'pending')
+
+    def __init__(self):
+        self.docs = []
+        self.pending = []
+
+    def __len__(self):
+        return len(self.docs) + len(self.pending)
+
+    def add(self, doc_id):
+        self.pending.append(doc_id)
+        if len(self.pending) > max(PENDING_LIMIT, len(self.docs)):
+            self.fold()
+
+    def remove(self, doc_id):
+        position = bisect_left(self.docs, doc_id)
+        if position < len(self.docs) and self.docs[position] == doc_id:
+            del self.docs[position]
+        else:
+            self.pending.remove(doc_id)
+
+    def fold(self):
+        self.docs.extend(self.pending)
+        self.docs.sort()
+        self.pending = []
+
+    def __iter__(self):
+        if len(self.pending) > PENDING_LIMIT:
+            self.fold()
+        if not self.pending:
+            return iter(self.docs)
+        self.pending.sort()
+        return heapq.merge(self.docs, self.pending)
+
+
+class SearchIndex:
+    """Inverted index over book title, author and category.
+
+    Postings map each token to the documents containing it with a field
+    weighted score, and tiers group those documents by score so they can be
+    scanned best first. A trigram index over the vocabulary provides typo
+    tolerant matching and a sorted vocabulary provides prefix completion.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.tiers = {}
+        self.doc_tokens = {}
+        self.trigram_index = {}
+        self.vocabulary = []
+
+    def __len__(self):
+        return len(self.doc_tokens)
+
+    def add(self, doc_id, fields):
+        """Index a document given a mapping of field name to text"""
+        if doc_id in self.doc_tokens:
+            self.remove(doc_id)
+        scores = {}
+        for field, text in fields.items():
+            weight = FIELD_WEIGHTS.get(field, 1.0)
+            for token in tokenize(text or ''):
+                scores[token] = scores.get(token, 0.0) + weight
+        for token, score in scores.items():
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = {}
+                self._add_term(token)
+            postings[doc_id] = score
+            self.tiers.setdefault(token, {}).setdefault(score, Tier()).add(doc_id)
+        self.doc_tokens[doc_id] = tuple(scores)
+
+    def remove(self, doc_id):
+        for token in self.doc_tokens.pop(doc_id, ()):
+            postings = self.postings[token]
+            score = postings.pop(doc_id)
+            tiers = self.tiers[token]
+            tiers[score].remove(doc_id)
+            if not tiers[score]:
+                del tiers[score]
+            if not postings:
+                del self.postings[token]
+                del self.tiers[token]
+                self._remove_term(token)
+
+    def fold(self):
+        """Sort every pending addition into its tier, e.g. after a bulk build"""
+        for tiers in self.tiers.values():
+            for tier in tiers.values():
+                if tier.pending:
+                    tier.fold()
+
+    def _add_term(self, token):
+        insort(self.vocabulary, token)
+        for gram in trigrams(token):
+            self.trigram_index.setdefault(gram, set()).add(token)
+
+    def _remove_term(self, token):
+        del self.vocabulary[bisect_left(self.vocabulary, token)]
+        for gram in trigrams(token):
+            terms = self.trigram_index[gram]
+            terms.discard(token)
+            if not terms:
+                del self.trigram_index[gram]
+
+    def prefix_terms(self, prefix, limit=MAX_EXPANSIONS):
+        """Vocabulary terms starting with prefix, in sorted order"""
+        start = bisect_left(self.vocabulary, prefix)
+        terms = []
+        for term in self.vocabulary[start:start + limit]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def fuzzy_terms(self, token, limit=MAX_EXPANSIONS):
+        """Vocabulary terms whose trigram similarity to token passes the threshold"""
+        grams = trigrams(token)
+        shared = {}
+        for gram in grams:
+            for term in self.trigram_index.get(gram, ()):
+                shared[term] = shared.get(term, 0) + 1
+        matches = []
+        for term, count in shared.items():
+            similarity = count / (len(grams) + len(trigrams(term)) - count)
+            if similarity >= FUZZY_THRESHOLD:
+                matches.append((similarity, term))
+        return [(term, similarity) for similarity, term in heapq.nlargest(limit, matches)]
+
+    def expand(self, token, allow_prefix):
+        """Map a query token to weighted vocabulary terms"""
+        expansions = {}
+        if token in self.postings:
+            expansions[token] = EXACT_WEIGHT
+        if allow_prefix:
+            for term in self.prefix_terms(token):
+                expansions.setdefault(term, PREFIX_WEIGHT)
+        if not expansions:
+            for term, similarity in self.fuzzy_terms(token):
+                expansions[term] = FUZZY_WEIGHT * similarity
+        return expansions
+
+    def term_score(self, doc_id, expansions):
+        """Best weighted score of a document over a query token's expansions"""
+        best = 0.0
+        for term, weight in expansions.items():
+            score = weight * self.postings[term].get(doc_id, 0.0)
+            if score > best:
+                best = score
+        return best
+
+    def max_score(self, expansions):
+        return max(weight * max(self.tiers[term]) for term, weight in expansions.items())
+
+    def groups(self, expansions):
+        """Yield (score, size, doc ids in sorted order) for a token's documents, best score first"""
+        tiers = {}
+        for term, weight in expansions.items():
+            for score, tier in self.tiers[term].items():
+                tiers.setdefault(weight * score, []).append(tier)
+        for score in sorted(tiers, reverse=True):
+            same = tiers[score]
+            yield score, sum(map(len, same)), iter(same[0]) if len(same) == 1 else heapq.merge(*same)
+
+    def contenders(self, kth, first, driver, driver_score, others, others_bound, limit):
+        """Documents of a driver group, from id first on, that may still outrank kth.
+
+        Outranking kth leaves the other tokens less than (others_bound -
+        kth score + driver score) short of their best scores in total, so
+        every token must score above its best minus that. The token where
+        the fewest documents do supplies the candidates. Returns None when
+        that is limit documents or more.
+        """
+        kth_score, kth_id = kth
+        # Unscanned documents have larger ids than kth, so they lose ties
+        strict = kth_id < first
+        budget = others_bound - (kth_score - driver_score)
+        fewest = None
+        for expansions in others:
+            threshold = self.max_score(expansions) - budget + (EPSILON if strict else -EPSILON)
+            tiers = [tier for term, weight in expansions.items()
+                     for score, tier in self.tiers[term].items() if weight * score > threshold]
+            size = sum(map(len, tiers))
+            if fewest is None or size < fewest[0]:
+                fewest = (size, tiers)
+        if fewest[0] >= limit:
+            return None
+        return sorted({doc_id for tier in fewest[1] for doc_id in tier
+                       if doc_id >= first and self.term_score(doc_id, driver) == driver_score})
+
+    def search(self, query, page=1, per_page=20):
+        """Return (doc_ids, total) for one page of ranked results.
+
+        A document matches when it matches every query term found in the
+        vocabulary; the last term is also treated as a prefix so partially
+        typed words still match. Matches rank by summed field weighted
+        score, then by id.
+
+        Only the rarest term's postings are scanned, best score first, and
+        the other terms are probed per document. The scan stops once no
+        unscanned document can reach the requested page, so common terms
+        cost about as much as rare ones. Unless the query is a single exact
+        term, total is estimated from the part scanned when the rarest term
+        has more than MAX_COUNT postings.
+        """
+        tokens = tokenize(query)
+        terms = [expansions for expansions in (
+            self.expand(token, allow_prefix=position == len(tokens) - 1)
+            for position, token in enumerate(tokens)) if expansions]
+        if not terms:
+            return [], 0
+        terms.sort(key=lambda expansions: sum(len(self.postings[term]) for term in expansions))
+        driver, others = terms[0], terms[1:]
+        driver_size = sum(len(self.postings[term]) for term in driver)
+        others_bound = sum(self.max_score(expansions) for expansions in others)
+        wanted = max(page, 1) * per_page
+        # A single term matches all its postings, so its total is known upfront
+        counted = not others and len(driver) == 1
+        exhaustive = driver_size <= MAX_COUNT and not counted
+        rank = lambda match: (-match[0], match[1])
+
+        matches = []
+        seen = set()
+
+        def evaluate(doc_id, driver_score):
+            seen.add(doc_id)
+            score = driver_score
+            for expansions in others:
+                term_score = self.term_score(doc_id, expansions)
+                if not term_score:
+                    return None
+                score += term_score
+            score = round(score, 9)
+            matches.append((score, doc_id))
+            return score
+
+        # Matches among the documents scanned in order, for estimating total
+        scanned = sampled = 0
+        complete = True
+        groups = list(self.groups(driver))
+        for position, (driver_score, size, docs) in enumerate(groups):
+            bound = round(driver_score + others_bound, 9)
+            # Matches no unscanned document of this group can outrank
+            ahead = sum(1 for score, _ in matches if score > bound)
+            group_scanned = 0
+            shortcut = not exhaustive and others
+            for doc_id in docs:
+                if doc_id in seen:
+                    continue
+                if not exhaustive and ahead >= wanted:
+                    complete = False
+                    break
+                if shortcut and len(matches) >= wanted:
+                    shortcut = False
+                    kth = heapq.nsmallest(wanted, matches, key=rank)[-1]
+                    rest = self.contenders(kth, doc_id, driver, driver_score, others, others_bound,
+                                           size - group_scanned)
+                    if rest is not None:
+                        for contender in rest:
+                            if contender not in seen:
+                                evaluate(contender, driver_score)
+                        complete = False
+                        break
+                group_scanned += 1
+                score = evaluate(doc_id, driver_score)
+                if score is not None:
+                    sampled += 1
+                    # Later documents of the group have larger ids, so a tie wins
+                    if score >= bound:
+                        ahead += 1
+            scanned += group_scanned
+            if not exhaustive and position + 1 < len(groups):
+                next_bound = round(groups[position + 1][0] + others_bound, 9)
+                if sum(1 for score, _ in matches if score > next_bound) >= wanted:
+                    complete = False
+                    break
+
+        if counted:
+            total = driver_size
+        elif complete:
+            total = len(matches)
+        else:
+            total = max(round(sampled * driver_size / max(scanned, 1)), len(matches))
+        ranked = heapq.nsmallest(wanted, matches, key=rank)
+        return [doc_id for _, doc_id in ranked[(max(page, 1) - 1) * per_page:]], total
@@ -0,0 +1,200 @@
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+import collections
+import itertools
+import threading
+import time
+
+
+# Per-tick behaviour of the simulated agents
+DEFAULT_BEHAVIOUR = {
+    'search_rate': 0.5,       # chance a member searches for a title each tick
+    'borrow_rate': 0.2,       # chance a member borrows the book it found
+    'zipf_exponent': 1.1,     # skew of title popularity; higher is more skewed
+    'admin_edit_rate': 0.1,   # chance an admin adds or removes a book each tick
+    'durable': False,         # wait for each save to reach storage
+    'workers': 1,             # threads stepping agents concurrently
+}
+
+# Borrow refusals that are expected under load, by outcome
+BORROW_REFUSALS = {
+    "Book is not available": 'conflict',
+    "You already have this book on loan": 'already_borrowed',
+}
+
+
+class ZipfSampler:
+    """Draw items with probability proportional to 1 / rank ** exponent"""
+
+    def __init__(self, items, exponent, random):
+        self.items = items
+        self.random = random
+        self.cumulative = list(itertools.accumulate(1.0 / rank ** exponent
+                                                    for rank in range(1, len(items) + 1)))
+
+    def sample(self):
+        target = self.random.random() * self.cumulative[-1]
+        return self.items[min(bisect_left(self.cumulative, target), len(self.items) - 1)]
+
+
+def percentile(ordered, fraction):
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class LoadSimulation:
+    """Drive a LibraryModel as a load generator through its Mesa schedule.
+
+    While attached, each model.step() has every member search for a title
+    drawn from a Zipf popularity distribution and sometimes borrow it, and
+    every admin sometimes add or remove a book. A step stands for a day, so
+    members return their loans after the model's loan period. Latency and outcome of each
+    operation are recorded for report().
+    """
+
+    def __init__(self, model, **behaviour):
+        unknown = set(behaviour) - set(DEFAULT_BEHAVIOUR)
+        if unknown:
+            raise ValueError(f"Unknown simulation settings: {', '.join(sorted(unknown))}")
+        self.model = model
+        self.behaviour = dict(DEFAULT_BEHAVIOUR, **behaviour)
+        self.random = model.random
+
+        with model.lock.read_locked():
+            titles = sorted({record.title for record in model.book_records.values()})
+        if not titles:
+            raise ValueError("The catalog is empty")
+        # Popularity rank is a random permutation of the catalog
+        self.random.shuffle(titles)
+        self.titles = ZipfSampler(titles, self.behaviour['zipf_exponent'], self.random)
+
+        self.lock = threading.Lock()
+        self.latencies = collections.defaultdict(list)
+        self.outcomes = collections.defaultdict(collections.Counter)
+        self.added_books = []
+        # Books each member has borrowed, with the step they borrowed them on
+        self.loans = collections.defaultdict(list)
+        self.book_numbers = itertools.count()
+        self.elapsed = 0.0
+        self.steps = 0
+        self.lock_stats = model.lock.stats()
+        self.book_lock_stats = model.book_locks.stats()
+        workers = self.behaviour['workers']
+        self.executor = ThreadPoolExecutor(workers) if workers > 1 else None
+        model.simulation = self
+
+    def record(self, operation, seconds, outcome='ok'):
+        with self.lock:
+            self.latencies[operation].append(seconds)
+            self.outcomes[operation][outcome] += 1
+
+    def member_step(self, member):
+        # One step is one day: loans come back once the loan period is over
+        loans = self.loans[member.unique_id]
+        while loans and self.steps - loans[0][1] >= self.model.loan_period_days:
+            book_uri, _ = loans.pop(0)
+            started = time.perf_counter()
+            success, _ = member.return_book(book_uri, self.behaviour['durable'])
+            self.record('return', time.perf_counter() - started, 'ok' if success else 'error')
+
+        if self.random.random() >= self.behaviour['search_rate']:
+            return
+        started = time.perf_counter()
+        book = self.model.search_book(self.titles.sample())
+        self.record('search', time.perf_counter() - started, 'ok' if book else 'not_found')
+        if book is None or self.random.random() >= self.behaviour['borrow_rate']:
+            return
+
+        started = time.perf_counter()
+        success, message = member.borrow_book(book['uri'], self.behaviour['durable'])
+        if success:
+            outcome = 'ok'
+            loans.append((book['uri'], self.steps))
+        else:
+            outcome = BORROW_REFUSALS.get(message, 'error')
+        self.record('borrow', time.perf_counter() - started, outcome)
+
+    def admin_step(self, admin):
+        if self.random.random() >= self.behaviour['admin_edit_rate']:
+            return
+        with self.lock:
+            book_uri = self.added_books.pop() if self.added_books and self.random.random() < 0.5 else None
+        if book_uri is not None:
+            started = time.perf_counter()
+            success = admin.remove_book(book_uri, self.behaviour['durable'])
+            self.record('remove_book', time.perf_counter() - started, 'ok' if success else 'error')
+            return
+
+        number = next(self.book_numbers)
+        title = f"Simulated Book {number}"
+        started = time.perf_counter()
+        success = admin.add_book(title, f"sim-{number}", "Simulation", 2024, "simulation",
+                                 self.behaviour['durable'])
+        self.record('add_book', time.perf_counter() - started, 'ok' if success else 'error')
+        book = self.model.search_book(title) if success else None
+        if book is not None:
+            with self.lock:
+                self.added_books.append(book['uri'])
+
+    def step(self):
+        """Activate every agent once, in random order"""
+        started = time.perf_counter()
+        if self.executor is None:
+            self.model.schedule.step()
+        else:
+            agents = list(self.model.schedule.agents)
+            self.random.shuffle(agents)
+            for _ in self.executor.map(lambda agent: agent.step(), agents):
+                pass
+            self.model.schedule.steps += 1
+            self.model.schedule.time += 1
+        self.elapsed += time.perf_counter() - started
+        self.steps += 1
+
+    def run(self, steps):
+        for _ in range(steps):
+            self.model.step()
+        return self.report()
+
+    def report(self):
+        """Throughput, outcome counts, latency and lock contention so far"""
+        elapsed = self.elapsed or float('inf')
+        with self.lock:
+            operations = {}
+            for operation, samples in sorted(self.latencies.items()):
+                ordered = sorted(samples)
+                operations[operation] = {
+                    'count': len(ordered),
+                    'outcomes': dict(self.outcomes[operation]),
+                    'throughput_per_s': len(ordered) / elapsed,
+                    'mean_ms': 1000 * sum(ordered) / len(ordered),
+                    'p50_ms': 1000 * percentile(ordered, 0.5),
+                    'p95_ms': 1000 * percentile(ordered, 0.95),
+                    'p99_ms': 1000 * percentile(ordered, 0.99),
+                    'max_ms': 1000 * ordered[-1],
+                }
+        lock_stats = self.model.lock.stats()
+        book_lock_stats = self.model.book_locks.stats()
+        borrows = operations.get('borrow', {}).get('outcomes', {})
+        return {
+            'steps': self.steps,
+            'elapsed_s': self.elapsed,
+            'agents': len(self.model.schedule.agents),
+            'behaviour': dict(self.behaviour),
+            'operations': operations,
+            'contention': {
+                'borrow_conflicts': borrows.get('conflict', 0),
+                'lock_read_waits': lock_stats['read_waits'] - self.lock_stats['read_waits'],
+                'lock_write_waits': lock_stats['write_waits'] - self.lock_stats['write_waits'],
+                'lock_wait_seconds': lock_stats['wait_seconds'] - self.lock_stats['wait_seconds'],
+                'book_lock_waits': book_lock_stats['waits'] - self.book_lock_stats['waits'],
+                'book_lock_wait_seconds': book_lock_stats['wait_seconds'] - self.book_lock_stats['wait_seconds'],
+            },
+        }
+
+    def close(self):
+        """Stop the worker threads and detach from the model"""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        if self.model.simulation is self:
+            self.model.simulation = None
@@ -0,0 +1,151 @@
+from functools import lru_cache
+from rdflib import BNode, Literal, URIRef
+from rdflib.store import Store
+import json
+import sqlite3
+import threading
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS triples (
+    s TEXT NOT NULL,
+    p TEXT NOT NULL,
+    o TEXT NOT NULL,
+    PRIMARY KEY (s, p, o)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS triples_pos ON triples (p, o, s);
+CREATE INDEX IF NOT EXISTS triples_osp ON triples (o, s, p);
+CREATE TABLE IF NOT EXISTS namespaces (
+    prefix TEXT PRIMARY KEY,
+    uri TEXT NOT NULL
+);
+"""
+
+
+def encode_term(term):
+    """Encode an RDF term as a tagged string that round-trips exactly"""
+    if isinstance(term, Literal):
+        datatype = str(term.datatype) if term.datatype else None
+        return "L" + json.dumps([str(term), datatype, term.language])
+    if isinstance(term, BNode):
+        return "B" + str(term)
+    return "U" + str(term)
+
+
+@lru_cache(maxsize=65536)
+def decode_term(value):
+    tag, body = value[0], value[1:]
+    if tag == "L":
+        lexical, datatype, language = json.loads(body)
+        return Literal(lexical, datatype=datatype, lang=language)
+    if tag == "B":
+        return BNode(body)
+    return URIRef(body)
+
+
+class SQLiteStore(Store):
+    """rdflib store keeping triples in an indexed SQLite table.
+
+    The database runs in WAL mode so readers never block behind a writer.
+    Changes accumulate in an open SQLite transaction until commit().
+    """
+
+    context_aware = False
+    formula_aware = False
+    transaction_aware = True
+
+    def __init__(self, db_path):
+        super().__init__()
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+    def _where(self, triple):
+        clauses, params = [], []
+        for column, term in zip("spo", triple):
+            if term is not None:
+                clauses.append(f"{column} = ?")
+                params.append(encode_term(term))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def add(self, triple, context=None, quoted=False):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO triples (s, p, o) VALUES (?, ?, ?)",
+                [encode_term(term) for term in triple],
+            )
+        super().add(triple, context, quoted)
+
+    def addN(self, quads):
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO triples (s, p, o) VALUES (?, ?, ?)",
+                ([encode_term(s), encode_term(p), encode_term(o)] for s, p, o, _ in quads),
+            )
+
+    def remove(self, triple, context=None):
+        where, params = self._where(triple)
+        with self.lock:
+            self.connection.execute(f"DELETE FROM triples{where}", params)
+
+    def triples(self, triple_pattern, context=None):
+        where, params = self._where(triple_pattern)
+        with self.lock:
+            rows = self.connection.execute(f"SELECT s, p, o FROM triples{where}", params).fetchall()
+        for s, p, o in rows:
+            yield (decode_term(s), decode_term(p), decode_term(o)), iter(())
+
+    def __len__(self, context=None):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM triples").fetchone()[0]
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def bind(self, prefix, namespace, override=True):
+        with self.lock:
+            existing = self.connection.execute(
+                "SELECT prefix FROM namespaces WHERE uri = ?", (str(namespace),)).fetchone()
+            if existing and not override:
+                return
+            self.connection.execute("DELETE FROM namespaces WHERE uri = ?", (str(namespace),))
+            self.connection.execute(
+                "INSERT OR REPLACE INTO namespaces (prefix, uri) VALUES (?, ?)",
+                (prefix, str(namespace)),
+            )
+
+    def namespace(self, prefix):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT uri FROM namespaces WHERE prefix = ?", (prefix,)).fetchone()
+        return URIRef(row[0]) if row else None
+
+    def prefix(self, namespace):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT prefix FROM namespaces WHERE uri = ?", (str(namespace),)).fetchone()
+        return row[0] if row else None
+
+    def namespaces(self):
+        with self.lock:
+            rows = self.connection.execute("SELECT prefix, uri FROM namespaces").fetchall()
+        for prefix, uri in rows:
+            yield prefix, URIRef(uri)
+
+    def commit(self):
+        with self.lock:
+            self.connection.commit()
+
+    def rollback(self):
+        with self.lock:
+            self.connection.rollback()
+
+    def close(self, commit_pending_transaction=False):
+        with self.lock:
+            if commit_pending_transaction:
+                self.connection.commit()
+            self.connection.close()
@@ -0,0 +1,50 @@
+"""Partitioned persistence loads archived history only as far as it is read."""
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from library_system import LibraryModel
+from persistence import ARCHIVE_PREFIX
+from synthetic import write_ontology
+
+
+@pytest.fixture
+def rdf_path(tmp_path):
+    path = str(tmp_path / 'library.rdf')
+    write_ontology(path, books=30, members=20, categories=5, transactions=3000)
+    # The first start seeds the partitions and keeps the whole history loaded
+    LibraryModel(path, persistence='partitioned').close()
+    return path
+
+
+def loaded_archives(model):
+    return sorted(name for name in model.persistence.loaded if name.startswith(ARCHIVE_PREFIX))
+
+
+def test_first_page_loads_only_newest_partitions(rdf_path):
+    everything = LibraryModel(rdf_path, persistence='partitioned')
+    everything.load_history()
+    expected = everything.transactions_page(None, 20, descending=True)
+
+    model = LibraryModel(rdf_path, persistence='partitioned')
+    archives = model.persistence.archives()
+    assert loaded_archives(model) == []
+
+    assert model.transactions_page(None, 20, descending=True) == expected
+    loaded = loaded_archives(model)
+    assert 0 < len(loaded) <= 2
+    assert loaded == archives[-len(loaded):]
+
+
+def test_export_streams_archives_without_loading_them(rdf_path):
+    model = LibraryModel(rdf_path, persistence='partitioned')
+    rows = [json.loads(line) for line in model.export_stream('jsonl', 'transaction')]
+
+    assert loaded_archives(model) == []
+    assert len(rows) == len({row['uri'] for row in rows}) == 3000